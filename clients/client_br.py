@@ -3,7 +3,11 @@ import uasyncio as asyncio
 from common.common import *
 from clients.config import set_led
 from clients.config import config
+from clients import device_time
 from clients.mqtt_as import MQTTClient
+from clients.payload import encode_payload
+from clients.payload import payload_timed
+from clients.sampler import Sampler
 from clients.sht30 import SHT30
 from clients.sht30 import SHT30Error
 
@@ -32,22 +36,28 @@ async def main(client):
             set_led(1)
             await asyncio.sleep(sleep_period_seconds)
 
-    sensor = SHT30()
+    sampler = Sampler(SHT30())
     while True:
-        await asyncio.sleep(sleep_period_seconds)
-        success = client.isconnected()
-        if success:
-            try:
-                temperature, humidity = sensor.measure()
-                await client.publish(str(sensor_topic), '{} {}'.format(temperature, humidity), qos=0)
-            except (TypeError, SHT30Error):
-                success = False
+        await asyncio.sleep(sensor_sample_period_seconds)
+        try:
+            await sampler.sample()  # keep sampling while disconnected so the filter stays current
+            success = client.isconnected()
+        except (TypeError, SHT30Error):
+            success = False
+        if success and sampler.publish_due():
+            timestamp = device_time.unix_time()
+            await client.publish(str(sensor_topic), encode_payload(sampler.temp_word, sampler.humidity_word, timestamp),
+                                 retain=payload_timed and timestamp is not None, qos=0)
+            sampler.mark_published()
+        if success and device_time.sync_due():
+            device_time.sync()  # blocks briefly, the next sample is a sample period away
         set_led(int(not success))
 
 
 def run():
     config['subs_cb'] = subscription_callback
     config['connect_coro'] = connect_coroutine
+    config['will'] = (str(sensor_topic), offline_payload, True, 1)  # retained so a restarted controller sees it too
 
     MQTTClient.DEBUG = False
     client = MQTTClient(config)
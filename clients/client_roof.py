@@ -1,17 +1,33 @@
-import time
 import uasyncio as asyncio
 from machine import Pin
 
 from common.common import *
 from clients.config import set_led
 from clients.config import config
+from clients import device_time
 from clients.mqtt_as import MQTTClient
+from clients.payload import encode_payload
+from clients.payload import payload_timed
+from clients.sampler import Sampler
 from clients.sht30 import SHT30
 from clients.sht30 import SHT30Error
 
 
 valve_moving_period = 20
+
+
+class ValvePhase:
+    IDLE = 0  # not moved since boot
+    MOVING = 1
+    SETTLED = 2
+
+
+fan_state = FanSpeeds.OFF
+valve_phase = ValvePhase.IDLE
 valves_state = ValveStates.unknown
+valves_target = ValveStates.unknown
+valves_move_id = 0  # incremented to cancel a movement in progress
+mqtt_client = None
 sensor_topic = Topic.ROOF_TEMP_HUM
 fan_low_pin = Pin(12, Pin.OUT)  # D6
 fan_high_pin = Pin(13, Pin.OUT)  # D7
@@ -24,6 +40,7 @@ valves_extract_living_pin.off()
 
 
 def set_fan(mode):
+    global fan_state
     if mode == FanSpeeds.OFF:
         fan_low_pin.off()
         fan_high_pin.off()
@@ -33,22 +50,54 @@ def set_fan(mode):
     elif mode == FanSpeeds.HIGH:
         fan_low_pin.off()
         fan_high_pin.on()
+    else:
+        return
+    fan_state = mode
+    asyncio.get_event_loop().create_task(publish_fan_state())
 
 
 def set_valves(mode):
-    global valves_state
-    if mode == valves_state or valves_state == ValveStates.transitioning:
+    # Called from the mqtt callback so it only schedules the movement, blocking here would stall the client.
+    global valves_target, valves_move_id
+    if mode == valves_target:
+        if valve_phase == ValvePhase.SETTLED:
+            asyncio.get_event_loop().create_task(publish_valve_state())  # controller is retrying, ack again
         return  # duplicate msg
-    else:
-        valves_state = ValveStates.transitioning
+    valves_target = mode
+    valves_move_id += 1
+    asyncio.get_event_loop().create_task(move_valves(mode, valves_move_id))
+
+
+async def move_valves(mode, move_id):
+    global valve_phase, valves_state
+    valves_extract_roof_pin.off()
+    valves_extract_living_pin.off()
+    valve_phase = ValvePhase.MOVING
+    valves_state = ValveStates.transitioning
+    await publish_valve_state()
+    if move_id != valves_move_id:
+        return  # cancelled while publishing
     if mode == ValveStates.extract_from_living:
         valves_extract_living_pin.on()
     elif mode == ValveStates.extract_from_roof:
         valves_extract_roof_pin.on()
-    time.sleep(valve_moving_period)
-    valves_state = mode
+    for second in range(valve_moving_period):
+        await asyncio.sleep(1)
+        if move_id != valves_move_id:
+            return  # a newer movement has taken over the pins
     valves_extract_roof_pin.off()
     valves_extract_living_pin.off()
+    valve_phase = ValvePhase.SETTLED
+    valves_state = mode
+    await publish_valve_state()
+
+
+async def publish_valve_state():
+    await mqtt_client.publish(str(Topic.VALVE_STATE), str(valves_state), retain=True, qos=1)
+
+
+async def publish_fan_state():
+    await mqtt_client.publish(str(Topic.FAN_STATE), str(fan_state), retain=True, qos=1)
 
 
 def subscription_callback(topic, msg, retained):
@@ -65,6 +114,8 @@ async def connect_coroutine(client):
     # Subscribe here so subs are renewed on reconnect
     await client.subscribe(str(Topic.SET_FAN), 1)
     await client.subscribe(str(Topic.SET_VALVES), 1)
+    await publish_fan_state()
+    await publish_valve_state()
 
 
 async def main(client):
@@ -78,25 +129,33 @@ async def main(client):
             set_led(1)
             await asyncio.sleep(sleep_period_seconds)
 
-    sensor = SHT30()
+    sampler = Sampler(SHT30())
     while True:
-        await asyncio.sleep(sleep_period_seconds)
-        success = client.isconnected()
-        if success:
-            try:
-                temperature, humidity = sensor.measure()
-                await client.publish(str(sensor_topic), '{} {}'.format(temperature, humidity), qos=0)
-            except (TypeError, SHT30Error):
-                success = False
+        await asyncio.sleep(sensor_sample_period_seconds)
+        try:
+            await sampler.sample()  # keep sampling while disconnected so the filter stays current
+            success = client.isconnected()
+        except (TypeError, SHT30Error):
+            success = False
+        if success and sampler.publish_due():
+            timestamp = device_time.unix_time()
+            await client.publish(str(sensor_topic), encode_payload(sampler.temp_word, sampler.humidity_word, timestamp),
+                                 retain=payload_timed and timestamp is not None, qos=0)
+            sampler.mark_published()
+        if success and device_time.sync_due():
+            device_time.sync()  # blocks briefly, the next sample is a sample period away
         set_led(int(not success))
 
 
 def run():
+    global mqtt_client
     config['subs_cb'] = subscription_callback
     config['connect_coro'] = connect_coroutine
+    config['will'] = (str(sensor_topic), offline_payload, True, 1)  # retained so a restarted controller sees it too
 
     MQTTClient.DEBUG = False
     client = MQTTClient(config)
+    mqtt_client = client
     loop = asyncio.get_event_loop()
     try:
         loop.run_until_complete(main(client))
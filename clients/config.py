@@ -1,6 +1,7 @@
 from machine import Pin
 
 from clients.mqtt_as import config
+from common.common import *
 
 config['server'] = '192.168.0.0'  # Change to suit
 
@@ -8,6 +9,9 @@ config['server'] = '192.168.0.0'  # Change to suit
 config['ssid'] = 'todo'
 config['wifi_pw'] = 'todo'
 
+sensor_payload_format = PayloadFormat.TEXT  # PayloadFormat.RAW_SHT30 sends 9 bytes instead of formatted floats
+# Only TEXT and CENTI_TIME carry the time of the reading, which is needed for readings to be retained.
+
 
 def ledfunc(pin):
     pin = pin
@@ -0,0 +1,40 @@
+"""
+Wall clock time for sensor readings, set from NTP soon after start up and then every hour.
+Readings carry it so the controller can tell how old a retained reading is. Until the clock has been set there is
+no timestamp and readings are published without the retain flag. The RTC drifts, and a clock running behind would
+make every reading look old, so it is set again periodically rather than only on connect.
+ntptime blocks for up to its socket timeout, so clients call sync() just after publishing, when nothing else is due.
+"""
+
+import time
+
+import ntptime
+
+from common.common import *
+
+
+epoch_offset = micropython_epoch_offset if time.gmtime(0)[0] == 2000 else 0
+resync_period_ms = 60 * 60 * 1000
+retry_period_ms = 60 * 1000  # after a failed sync
+_synced = False
+_next_sync = time.ticks_ms()
+
+
+def sync_due():
+    return time.ticks_diff(time.ticks_ms(), _next_sync) >= 0
+
+
+def sync():
+    global _synced, _next_sync
+    try:
+        ntptime.settime()
+        _synced = True
+        _next_sync = time.ticks_add(time.ticks_ms(), resync_period_ms)
+    except OSError:
+        _next_sync = time.ticks_add(time.ticks_ms(), retry_period_ms)  # keeps the time from an earlier sync, if any
+
+
+def unix_time():
+    if not _synced:
+        return None
+    return time.time() + epoch_offset
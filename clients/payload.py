@@ -0,0 +1,29 @@
+import struct
+
+from common.common import *
+from clients.config import sensor_payload_format
+
+
+_sequence = 0
+# Readings are only retained if they say when they were taken, otherwise a restarted controller can't tell their age.
+payload_timed = sensor_payload_format in (PayloadFormat.TEXT, PayloadFormat.CENTI_TIME)
+
+
+def encode_payload(temp_word, humidity_word, timestamp=None):
+    # Returns raw SHT30 words as a payload in the configured PayloadFormat, with the unix time if it is known.
+    global _sequence
+    _sequence = (_sequence + 1) & 0xFFFF
+    if sensor_payload_format == PayloadFormat.RAW_SHT30:
+        return struct.pack(payload_layouts[PayloadFormat.RAW_SHT30], PayloadFormat.RAW_SHT30, firmware_version,
+                           _sequence, temp_word, humidity_word)
+    temperature = sht30_celsius(temp_word)
+    humidity = sht30_humidity(humidity_word)
+    if sensor_payload_format == PayloadFormat.CENTI_TIME:
+        return struct.pack(payload_layouts[PayloadFormat.CENTI_TIME], PayloadFormat.CENTI_TIME, firmware_version,
+                           _sequence, timestamp or 0, int(temperature * 100), int(humidity * 100))
+    if sensor_payload_format == PayloadFormat.CENTI_SEQ:
+        return struct.pack(payload_layouts[PayloadFormat.CENTI_SEQ], PayloadFormat.CENTI_SEQ, firmware_version,
+                           _sequence, int(temperature * 100), int(humidity * 100))
+    if timestamp is not None:
+        return '{:.2f} {:.2f} {:d}'.format(temperature, humidity, timestamp)
+    return '{:.2f} {:.2f}'.format(temperature, humidity)
@@ -0,0 +1,58 @@
+import time
+
+import uasyncio as asyncio
+
+from common.common import *
+
+
+# Works on the raw SHT30 words so filtering needs no floating point.
+oversample_count = 5
+oversample_gap_ms = 20
+ema_shift = 2  # smoothing factor of 1/4
+temp_threshold_words = 75  # about 0.2 C
+humidity_threshold_words = 655  # about 1 %RH
+
+
+def median(values):
+    values.sort()
+    return values[len(values) // 2]
+
+
+class Sampler:
+    def __init__(self, sensor):
+        self.sensor = sensor
+        self.temp_word = None
+        self.humidity_word = None
+        self._published = None
+        self._published_ms = 0
+
+    async def sample(self):
+        # Takes the median of a burst of measurements to drop outliers, then smooths with an EMA.
+        temps = []
+        humidities = []
+        for i in range(oversample_count):
+            data = self.sensor.measure(raw=True)
+            temps.append(data[0] << 8 | data[1])
+            humidities.append(data[3] << 8 | data[4])
+            await asyncio.sleep_ms(oversample_gap_ms)
+        temp = median(temps)
+        humidity = median(humidities)
+        if self.temp_word is None:
+            self.temp_word = temp
+            self.humidity_word = humidity
+        else:
+            self.temp_word += (temp - self.temp_word) >> ema_shift
+            self.humidity_word += (humidity - self.humidity_word) >> ema_shift
+
+    def publish_due(self):
+        if self._published is None:
+            return self.temp_word is not None
+        if time.ticks_diff(time.ticks_ms(), self._published_ms) >= heartbeat_period_seconds * 1000:
+            return True
+        temp, humidity = self._published
+        return (abs(self.temp_word - temp) >= temp_threshold_words or
+                abs(self.humidity_word - humidity) >= humidity_threshold_words)
+
+    def mark_published(self):
+        self._published = (self.temp_word, self.humidity_word)
+        self._published_ms = time.ticks_ms()
@@ -1,5 +1,7 @@
 
 sleep_period_seconds = 60
+sensor_sample_period_seconds = 15
+heartbeat_period_seconds = 180  # sensors publish at least this often, sooner when a reading changes
 
 
 class Topic:
@@ -8,6 +10,8 @@ class Topic:
     ROOF_TEMP_HUM = 3
     SET_FAN = 4
     SET_VALVES = 5
+    VALVE_STATE = 6  # retained acknowledgement from the roof client, a ValveStates value
+    FAN_STATE = 7  # retained acknowledgement from the roof client, a FanSpeeds value
 
 
 class FanSpeeds:
@@ -21,3 +25,32 @@ class ValveStates:
     extract_from_roof = 2
     transitioning = 3
     unknown = 4
+
+
+firmware_version = 1
+micropython_epoch_offset = 946684800  # seconds from 1970 to 2000, the epoch of time.time() on the esp8266
+offline_payload = b'offline'  # retained last will on a sensor topic, replaced by the next reading
+
+
+class PayloadFormat:
+    # First byte of a binary sensor payload. Below any printable character so text payloads can't be mistaken for one.
+    TEXT = 0  # b'<temp> <hum>', no format byte
+    CENTI = 1  # temperature and humidity in hundredths
+    CENTI_SEQ = 2  # firmware version, sequence number, temperature and humidity in hundredths
+    RAW_SHT30 = 3  # firmware version, sequence number, raw SHT30 temperature and humidity words
+    CENTI_TIME = 4  # as CENTI_SEQ with the unix time of the reading after the sequence number
+
+
+# struct layouts, little endian and fixed size
+payload_layouts = {PayloadFormat.CENTI: '<Bhh',
+                   PayloadFormat.CENTI_SEQ: '<BBHhh',
+                   PayloadFormat.RAW_SHT30: '<BBHHH',
+                   PayloadFormat.CENTI_TIME: '<BBHIhh'}
+
+
+def sht30_celsius(word):
+    return word * 175 / 0xFFFF - 45  # conversions from the SHT30 datasheet
+
+
+def sht30_humidity(word):
+    return word * 100 / 0xFFFF
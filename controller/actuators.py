@@ -0,0 +1,70 @@
+"""
+Desired versus reported state of the actuators on the roof client.
+The roof client publishes the fan speed and valve position it has applied. A command is only sent when the desired
+value differs from what was last sent or reported, and is repeated with exponential backoff until the reported value
+converges. An actuator which never converges is flagged as dead so a failed roof node is noticed.
+"""
+
+import logging
+
+from . import clock
+
+
+retry_initial_seconds = 45  # longer than a valve movement
+retry_max_seconds = 15 * 60
+dead_after_retries = 4
+logger = logging.getLogger(__name__)
+
+
+class Actuator:
+    def __init__(self, name, command_topic):
+        self.name = name
+        self.command_topic = command_topic
+        self.desired = None
+        self.reported = None
+        self.reported_time = 0
+        self.sent_time = None
+        self.retries = 0
+        self.dead = False
+
+    def converged(self):
+        return self.desired is not None and self.reported == self.desired
+
+    def set_desired(self, value):
+        """
+        Returns True if a command should be sent now.
+        """
+        if value == self.desired:
+            return False  # already sent, due_command handles it if it isn't applied
+        self.desired = value
+        self.retries = 0
+        self.sent_time = None
+        return self.reported != value
+
+    def mark_sent(self):
+        self.sent_time = clock.time()
+
+    def report(self, value):
+        self.reported = value
+        self.reported_time = clock.time()
+        if self.converged():
+            self.sent_time = None
+            self.retries = 0
+            self.dead = False
+
+    def due_command(self):
+        """
+        Returns the desired value if it should be sent again, otherwise None.
+        """
+        if self.desired is None or self.converged():
+            return None
+        if self.sent_time is not None:
+            backoff = min(retry_initial_seconds * 2 ** self.retries, retry_max_seconds)
+            if clock.time() - self.sent_time < backoff:
+                return None
+            self.retries += 1
+            if self.retries >= dead_after_retries and not self.dead:
+                self.dead = True
+                logger.warning('%s actuator not responding after %d retries', self.name, self.retries)
+        # else it had converged and the reported value has since changed, e.g. the roof client restarted
+        return self.desired
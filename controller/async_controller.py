@@ -0,0 +1,170 @@
+"""
+Asyncio mode for the controller.
+A single event loop owns the mqtt client, the analysis scheduler and the HTTP server. Paho's socket is driven by
+loop readers and writers instead of its network thread and the Flask app is served by web_ui.aio_wsgi on the same
+loop, so every state mutation happens on one thread and the controller lock is replaced by a no-op.
+The controller's public methods are available as coroutines on AsyncController.
+"""
+
+import asyncio
+import logging
+import socket
+
+from common.common import *
+from web_ui import aio_wsgi
+from web_ui import ui_server
+from . import broker
+from . import controller
+from . import log
+
+
+reconnect_period_seconds = 5
+web_port = ui_server.web_port
+logger = logging.getLogger(__name__)
+
+
+class NullLock:
+    def acquire(self):
+        return True
+
+    def release(self):
+        pass
+
+
+class LoopOwnedController(controller.Controller):
+    # Controller whose state is only touched from the event loop thread.
+    def __init__(self, inputs_changed, history_dir=None, checkpoint_path=None):
+        self._loop_inputs_changed = inputs_changed
+        self._loop_snapshot_published = asyncio.Event()  # replaced on each publish, so waiters see only their own
+        super().__init__(history_dir, checkpoint_path, web_server=False)  # served from the loop by AsyncController
+        self.lock = NullLock()
+
+    def notify_inputs_changed(self):
+        self._loop_inputs_changed.set()
+
+    def notify_snapshot_published(self):
+        published, self._loop_snapshot_published = self._loop_snapshot_published, asyncio.Event()
+        published.set()
+
+    async def wait_for_snapshot_async(self, previous, timeout):
+        # wait_for_snapshot for coroutines on the loop, a Condition would block it
+        if self.snapshot is previous:
+            try:
+                await asyncio.wait_for(self._loop_snapshot_published.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self.snapshot
+
+
+class AsyncController:
+    def __init__(self, history_dir=None, port=web_port, checkpoint_path=None):
+        self.port = port
+        self._inputs_changed = asyncio.Event()
+        self.core = LoopOwnedController(self._inputs_changed, history_dir, checkpoint_path)
+        self._loop = None
+        self._connected = asyncio.Event()
+        self._web_server = None
+        self.broker = None
+
+    async def run(self):
+        self._loop = asyncio.get_running_loop()
+        core = self.core
+        core.on_socket_open = self._on_socket_open
+        core.on_socket_close = self._on_socket_close
+        core.on_socket_register_write = self._on_socket_register_write
+        core.on_socket_unregister_write = self._on_socket_unregister_write
+        core.on_disconnect = self._on_disconnect
+        if core.embedded_broker:
+            self.broker = broker.Broker('0.0.0.0', core.broker_port)
+            await self.broker.start()
+        self._web_server = await aio_wsgi.serve(ui_server.init_app(core), port=self.port,
+                                               streams=ui_server.async_streams)
+        await asyncio.gather(self._connection_loop(), self._misc_loop(), self._analysis_loop())
+
+    async def _connection_loop(self):
+        while True:
+            if not self._connected.is_set():
+                try:
+                    self.core.connect(self.core.broker_address, self.core.broker_port)
+                    self._connected.set()
+                except OSError as e:
+                    logger.warning('mqtt connect failed: %s', e)
+            await asyncio.sleep(reconnect_period_seconds)
+
+    async def _misc_loop(self):
+        while True:
+            await asyncio.sleep(1)
+            self.core.loop_misc()
+
+    async def _analysis_loop(self):
+        # same scheduling as Controller.wait_for_analysis_due
+        while True:
+            if self.core.event_driven:
+                try:
+                    await asyncio.wait_for(self._inputs_changed.wait(), sleep_period_seconds)
+                    await asyncio.sleep(self.core.debounce_seconds)  # let the rest of a burst arrive
+                except asyncio.TimeoutError:
+                    pass
+            else:
+                await asyncio.sleep(sleep_period_seconds)
+            self._inputs_changed.clear()
+            self.core.analyse_state()
+            if self.core.checkpoint_due():  # the state is read here, the file is synced off the loop
+                await self._loop.run_in_executor(None, self.core.save_checkpoint, self.core.checkpoint_state())
+
+    def _on_socket_open(self, client, userdata, sock):
+        self._loop.add_reader(sock, client.loop_read)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 2048)
+
+    def _on_socket_close(self, client, userdata, sock):
+        self._loop.remove_reader(sock)
+
+    def _on_socket_register_write(self, client, userdata, sock):
+        self._loop.add_writer(sock, client.loop_write)
+
+    def _on_socket_unregister_write(self, client, userdata, sock):
+        self._loop.remove_writer(sock)
+
+    def _on_disconnect(self, client, userdata, rc):
+        self._connected.clear()
+
+    async def increase_target_temp(self):
+        self.core.increase_target_temp()
+
+    async def decrease_target_temp(self):
+        self.core.decrease_target_temp()
+
+    async def request_flush(self):
+        self.core.request_flush()
+
+    async def get_hard_flush_requested(self):
+        return self.core.get_hard_flush_requested()
+
+    async def toggle_enable(self):
+        self.core.toggle_enable()
+
+    async def analyse_state(self):
+        self.core.analyse_state()
+
+    async def diagnostic_extract_living(self):
+        self.core.diagnostic_extract_living()
+
+    async def diagnostic_extract_roof(self):
+        self.core.diagnostic_extract_roof()
+
+    async def diagnostic_fan_off(self):
+        self.core.diagnostic_fan_off()
+
+    async def diagnostic_fan_low(self):
+        self.core.diagnostic_fan_low()
+
+    async def diagnostic_fan_high(self):
+        self.core.diagnostic_fan_high()
+
+
+def run_async_controller(history_dir=controller.default_history_dir,
+                         checkpoint_path=controller.default_checkpoint_path):
+    async def main():
+        await AsyncController(history_dir, checkpoint_path=checkpoint_path).run()
+    log.configure()
+    asyncio.run(main())
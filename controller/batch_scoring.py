@@ -0,0 +1,127 @@
+"""
+Vectorised EventSelector scoring over NumPy arrays for scoring history and parameter sweeps.
+Mirrors EventSelector.select_event and its score methods element by element, taking the hour of day as an array
+instead of reading the clock, and must make the same decisions as the scalar path.
+"""
+
+import datetime
+
+import numpy as np
+
+from . import hardware_state_machine
+from .event_selector import BenefitScores
+
+
+class BatchScores:
+    def __init__(self, roof_temp, lvrm_temp, roof_humidity, roof_worst, events):
+        self.roof_temp = roof_temp  # arrays of BenefitScores values
+        self.lvrm_temp = lvrm_temp
+        self.roof_humidity = roof_humidity
+        self.roof_worst = roof_worst  # bool array
+        self.events = events  # array of event strings
+
+
+def score_batch(selector, roof_temps, lvrm_temps, bdrm_temps, roof_rhs, lvrm_rhs, bdrm_rhs, hours,
+                target_temperature, enabled=True, fresh_data=True, force_hard_flush=False):
+    """
+    Temperatures, humidities and hours are equal length arrays. target_temperature, enabled, fresh_data and
+    force_hard_flush may be scalars or arrays. Scores are only meaningful where fresh_data is true.
+    """
+    hours = np.asarray(hours)
+    roof_temp_diff = np.asarray(roof_temps, dtype=float) - target_temperature
+    lvrm_temp_diff = np.asarray(lvrm_temps, dtype=float) - target_temperature
+    bdrm_temp_diff = np.asarray(bdrm_temps, dtype=float) - target_temperature
+    bedroom_temps_matter = (hours >= selector.beginning_bed_time) | (hours <= selector.getting_up_time)
+    want_quiet_fan = (hours >= selector.quiet_fan_start) | (hours <= selector.quiet_fan_end)
+
+    roof_temp = _temper_for_quiet_fan(
+        roof_temp_scores(selector, roof_temp_diff, lvrm_temp_diff, bdrm_temp_diff, bedroom_temps_matter),
+        want_quiet_fan)
+    lvrm_temp = _temper_for_quiet_fan(
+        lvrm_temp_scores(selector, lvrm_temp_diff, bdrm_temp_diff, bedroom_temps_matter), want_quiet_fan)
+    roof_humidity = _temper_for_quiet_fan(
+        roof_humidity_scores(selector, roof_rhs, lvrm_rhs, bdrm_rhs), want_quiet_fan)
+    roof_worst = roof_worst_sources(selector, roof_temp_diff, lvrm_temp_diff, bdrm_temp_diff, bedroom_temps_matter)
+
+    shape = roof_temp.shape
+    not_terrible = roof_temp != BenefitScores.terrible
+    conditions = [
+        np.broadcast_to(np.logical_not(enabled), shape),
+        np.broadcast_to(force_hard_flush, shape),
+        np.broadcast_to(np.logical_not(fresh_data), shape),
+        roof_temp == BenefitScores.ideal,
+        roof_temp == BenefitScores.good,
+        roof_temp == BenefitScores.ok,
+        lvrm_temp == BenefitScores.ideal,
+        lvrm_temp == BenefitScores.good,
+        lvrm_temp == BenefitScores.ok,
+        (roof_humidity == BenefitScores.ideal) & not_terrible,
+        (roof_humidity == BenefitScores.ok) & not_terrible,
+        roof_worst,
+    ]
+    choices = [
+        hardware_state_machine.force_idle_str,
+        hardware_state_machine.hard_flush_str,
+        hardware_state_machine.lvrm_worst_str,
+        hardware_state_machine.roof_ideal_str,
+        hardware_state_machine.roof_good__str,
+        hardware_state_machine.roof_go_on_str,
+        hardware_state_machine.lvrm_ideal_str,
+        hardware_state_machine.lvrm_good__str,
+        hardware_state_machine.lvrm_go_on_str,
+        hardware_state_machine.roof_ideal_str,
+        hardware_state_machine.roof_go_on_str,
+        hardware_state_machine.roof_worst_str,
+    ]
+    events = np.select(conditions, choices, default=hardware_state_machine.lvrm_worst_str)
+    return BatchScores(roof_temp, lvrm_temp, roof_humidity, roof_worst, events)
+
+
+def roof_temp_scores(selector, roof_temp_diff, lvrm_temp_diff, bdrm_temp_diff, bedroom_temps_matter):
+    house_error = np.where(bedroom_temps_matter, (lvrm_temp_diff + bdrm_temp_diff) / 2, lvrm_temp_diff)
+    roof_advantage = np.where(house_error < 0, roof_temp_diff - house_error, house_error - roof_temp_diff)
+    return temp_advantage_to_scores(selector, roof_advantage, house_error)
+
+
+def lvrm_temp_scores(selector, lvrm_temp_diff, bdrm_temp_diff, bedroom_temps_matter):
+    lvrm_advantage = np.where(bdrm_temp_diff < 0, lvrm_temp_diff - bdrm_temp_diff, bdrm_temp_diff - lvrm_temp_diff)
+    scores = temp_advantage_to_scores(selector, lvrm_advantage, bdrm_temp_diff)
+    return np.where(bedroom_temps_matter, scores, BenefitScores.bad).astype(np.int8)
+
+
+def roof_humidity_scores(selector, roof_rhs, lvrm_rhs, bdrm_rhs):
+    house_rh = (np.asarray(lvrm_rhs, dtype=float) + np.asarray(bdrm_rhs, dtype=float)) / 2
+    roof_advantage = house_rh - np.asarray(roof_rhs, dtype=float)
+    scores = np.select([roof_advantage > selector.humidity_hysteresis,
+                        roof_advantage > selector.min_humidity_advantage],
+                       [BenefitScores.ideal, BenefitScores.ok], BenefitScores.bad)
+    return np.where(house_rh > selector.max_rh, scores, BenefitScores.bad).astype(np.int8)
+
+
+def roof_worst_sources(selector, roof_temp_diff, lvrm_temp_diff, bdrm_temp_diff, bedroom_temps_matter):
+    bdrm_cold = bdrm_temp_diff < 0
+    roof_advantage = np.where(bdrm_cold, roof_temp_diff - bdrm_temp_diff, bdrm_temp_diff - roof_temp_diff)
+    lvrm_advantage = np.where(bdrm_cold, lvrm_temp_diff - bdrm_temp_diff, bdrm_temp_diff - lvrm_temp_diff)
+    return bedroom_temps_matter & (np.abs(bdrm_temp_diff) > selector.high_bedroom_error) & \
+        (lvrm_advantage > roof_advantage)
+
+
+def temp_advantage_to_scores(selector, temp_advantage, error):
+    abs_error = np.abs(error)
+    max_scores = np.select([abs_error < selector.min_temp_error_to_activate,
+                            abs_error < selector.min_temp_error_to_activate + selector.temp_hysteresis],
+                           [BenefitScores.bad, BenefitScores.ok], BenefitScores.ideal)
+    scores = np.select([temp_advantage > selector.min_temp_advantage + selector.temp_hysteresis,
+                        temp_advantage > selector.min_temp_advantage,
+                        temp_advantage > selector.terrible_roof_error],
+                       [BenefitScores.ideal, BenefitScores.ok, BenefitScores.bad], BenefitScores.terrible)
+    return np.minimum(scores, max_scores).astype(np.int8)
+
+
+def hours_of_day(timestamps):
+    # local hour for unix timestamps, matching the clock the scalar path reads
+    return np.array([datetime.datetime.fromtimestamp(t).hour for t in timestamps], dtype=np.int8)
+
+
+def _temper_for_quiet_fan(scores, want_quiet_fan):
+    return np.where(want_quiet_fan & (scores == BenefitScores.ideal), BenefitScores.good, scores).astype(np.int8)
@@ -0,0 +1,79 @@
+"""
+Measures RoomData parsing cost and per reading memory for text and binary payloads.
+The dict baseline only splits and converts. RoomData also detects binary payloads and range checks every reading, so
+its text parse is slower than the baseline; what __slots__ buys is memory per retained reading.
+Each timing is the best of many short batches, interleaved across the cases so a noisy neighbour slows them all.
+Run from the repository root: python -m controller.benchmark.bench_room_data
+"""
+import random
+import sys
+import time
+import tracemalloc
+
+from common.common import *
+from controller.controller import RoomData, payload_structs
+
+
+payload_count = 100000
+batch_size = 2000
+timing_rounds = 200
+retained_count = 100000
+
+
+class DictRoomData:
+    # the previous RoomData, kept as a baseline
+    def __init__(self, bytes_string):
+        temp_bs, hum_bs = bytes_string.split()
+        self.temp = float(temp_bs)
+        self.humidity = float(hum_bs)
+
+
+def synthetic_readings(count, seed=0):
+    rng = random.Random(seed)
+    return [(rng.randint(-1000, 4000), rng.randint(1000, 9500)) for _ in range(count)]
+
+
+def time_parsers(cases):
+    # returns the best time per parse for each (name, parser, payloads) case
+    best = [float('inf')] * len(cases)
+    for i in range(timing_rounds):
+        offset = i * batch_size % (payload_count - batch_size)
+        for j, (name, parser, payloads) in enumerate(cases):
+            batch = payloads[offset:offset + batch_size]
+            start = time.perf_counter()
+            for payload in batch:
+                parser(payload)
+            best[j] = min(best[j], time.perf_counter() - start)
+    return [elapsed / batch_size for elapsed in best]
+
+
+def retained_bytes(parser, payloads):
+    # bytes allocated per reading that is kept alive, as a sensor history or snapshot would
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = [parser(payload) for payload in payloads]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return (after - before - sys.getsizeof(kept)) / len(kept)
+
+
+def main():
+    readings = synthetic_readings(payload_count)
+    text = ['{:.2f} {:.2f}'.format(t / 100, h / 100).encode() for t, h in readings]
+    centi = payload_structs[PayloadFormat.CENTI]
+    binary = [centi.pack(PayloadFormat.CENTI, t, h) for t, h in readings]
+    sequenced = payload_structs[PayloadFormat.CENTI_SEQ]
+    binary_seq = [sequenced.pack(PayloadFormat.CENTI_SEQ, firmware_version, i & 0xFFFF, t, h)
+                  for i, (t, h) in enumerate(readings)]
+    now = int(time.time())
+    timed = [payload + ' {}'.format(now).encode() for payload in text]
+    cases = [('dict, text', DictRoomData, text), ('slots, text', RoomData, text), ('slots, timed', RoomData, timed),
+             ('slots, binary', RoomData, binary), ('slots, seq', RoomData, binary_seq)]
+    for (name, parser, payloads), per_parse in zip(cases, time_parsers(cases)):
+        per_reading = retained_bytes(parser, payloads[:retained_count])
+        print('{:<14} {:6.2f} us per parse   {:6.1f} bytes per retained reading'.format(
+            name, per_parse * 1e6, per_reading))
+
+
+if __name__ == '__main__':
+    main()
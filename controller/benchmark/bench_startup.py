@@ -0,0 +1,88 @@
+"""
+Startup profile of the controller: import time breakdown, time to the first decision and resident memory.
+Every measurement runs in a fresh interpreter so nothing is already imported. The time to first decision covers
+importing controller.controller, constructing the Controller and running one analyse_state. It is measured headless
+and with the web server thread, which imports the UI in the background while the first decision is made.
+Run from the repository root: python -m controller.benchmark.bench_startup
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+
+repository_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+web_settle_seconds = 2  # lets the web thread finish importing before RSS is read
+
+boot_script = '''
+import json, sys, time
+start = time.perf_counter()
+from controller import controller
+imported = time.perf_counter()
+core = controller.Controller(web_server={web_server})
+constructed = time.perf_counter()
+core.analyse_state()
+decided = time.perf_counter()
+if {web_server}:
+    time.sleep({settle})
+with open('/proc/self/status') as f:
+    rss_kb = int(f.read().split('VmRSS:')[1].split()[0])
+print(json.dumps({{'import': imported - start, 'construct': constructed - imported, 'first_decision': decided - start,
+                  'rss_mb': rss_kb / 1024, 'modules': len(sys.modules)}}))
+sys.stdout.flush()
+import os
+os._exit(0)  # the web thread isn't a daemon
+'''
+
+
+def run_python(args):
+    return subprocess.run([sys.executable] + args, cwd=repository_root, capture_output=True, text=True, check=True)
+
+
+def import_breakdown(module, top):
+    # -X importtime lines are 'import time: self | cumulative | name', nesting shown by indentation of the name
+    stderr = run_python(['-X', 'importtime', '-c', 'import ' + module]).stderr
+    children = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        ms = int(cumulative) / 1000
+        if depth == 0:
+            if name.strip() == module:
+                return ms, sorted(children, reverse=True)[:top]
+            children = []  # imported by the interpreter before the module
+        elif depth == 1:
+            children.append((ms, name.strip()))
+    raise ValueError(module + ' not in -X importtime output')
+
+
+def boot(web_server, repeats):
+    runs = [json.loads(run_python(['-c', boot_script.format(web_server=web_server, settle=web_settle_seconds)])
+                       .stdout.splitlines()[-1]) for i in range(repeats)]
+    return {key: min(run[key] for run in runs) for key in runs[0]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Profile controller startup.')
+    parser.add_argument('--repeats', type=int, default=3, help='boots per mode, the fastest is reported')
+    parser.add_argument('--top', type=int, default=10, help='imports shown in the breakdown')
+    args = parser.parse_args()
+
+    total, children = import_breakdown('controller.controller', args.top)
+    print('import controller.controller {:.0f} ms, largest direct imports:'.format(total))
+    for ms, name in children:
+        print('  {:<40} {:7.1f} ms'.format(name, ms))
+    print()
+    print('{:<10} {:>10} {:>12} {:>16} {:>8} {:>8}'.format('mode', 'import ms', 'construct ms', 'first decision ms',
+                                                           'rss MB', 'modules'))
+    for mode, web_server in [('headless', False), ('web', True)]:
+        r = boot(web_server, args.repeats)
+        print('{:<10} {:>10.0f} {:>12.1f} {:>16.0f} {:>8.1f} {:>8}'.format(
+            mode, r['import'] * 1000, r['construct'] * 1000, r['first_decision'] * 1000, r['rss_mb'], r['modules']))
+
+
+if __name__ == '__main__':
+    main()
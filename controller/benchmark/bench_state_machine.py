@@ -0,0 +1,48 @@
+"""
+Compares construction and per-trigger cost of the transitions based HardwareState with CompiledHardwareState.
+Run from the repository root: python -m controller.benchmark.bench_state_machine
+"""
+import timeit
+
+from controller import hardware_state_machine
+
+
+construction_runs = 200
+trigger_runs = 100000
+# cycles through condition failures, reflexive transitions and real state changes
+trigger_cycle = [hardware_state_machine.roof_go_on_str, hardware_state_machine.roof_ideal_str,
+                 hardware_state_machine.roof_ideal_str, hardware_state_machine.roof_good__str,
+                 hardware_state_machine.hard_flush_str, hardware_state_machine.force_idle_str]
+
+
+def time_construction(state_class):
+    return min(timeit.repeat(state_class, number=construction_runs, repeat=3)) / construction_runs
+
+
+def time_triggers(state_class):
+    machine = state_class()
+    methods = [getattr(machine, trigger) for trigger in trigger_cycle]
+    count = len(methods)
+
+    def run():
+        for i in range(trigger_runs):
+            methods[i % count]()
+            machine.pending_actions.clear()
+    return min(timeit.repeat(run, number=1, repeat=3)) / trigger_runs
+
+
+def main():
+    results = {}
+    for state_class in [hardware_state_machine.HardwareState, hardware_state_machine.CompiledHardwareState]:
+        results[state_class.__name__] = (time_construction(state_class), time_triggers(state_class))
+        construction, trigger = results[state_class.__name__]
+        print('{:<22} construction {:9.1f} us   per trigger {:7.2f} us'.format(
+            state_class.__name__, construction * 1e6, trigger * 1e6))
+    machine_construction, machine_trigger = results['HardwareState']
+    compiled_construction, compiled_trigger = results['CompiledHardwareState']
+    print('speedup: construction {:.1f}x, per trigger {:.1f}x'.format(
+        machine_construction / compiled_construction, machine_trigger / compiled_trigger))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""
+Measures requests per second and latency of the web UI under each serving mode.
+The server runs in its own process with a controller that has no mqtt connection. Keep-alive clients request the
+page and /api/state concurrently. --stuck opens connections that send half a request and stall, like a phone that
+walked out of wifi range, to show whether they hold up everyone else.
+Run from the repository root: python -m controller.benchmark.bench_web --modes flask,waitress,asyncio
+"""
+import argparse
+import asyncio
+import http.client
+import logging
+import multiprocessing
+import socket
+import threading
+import time
+
+from werkzeug.serving import make_server
+
+from controller import controller
+from web_ui import aio_wsgi
+from web_ui import ui_server
+
+
+paths = ['/', '/api/state']
+
+
+def serve(mode, ports):
+    app = ui_server.init_app(controller.Controller(web_server=False))
+    if mode == 'flask':
+        server = make_server('127.0.0.1', 0, app, threaded=True)
+        ports.put(server.server_port)
+        server.serve_forever()
+    elif mode == 'waitress':
+        logging.getLogger('waitress.queue').setLevel(logging.ERROR)  # queue depth warnings are expected here
+        server = ui_server.waitress.create_server(app, host='127.0.0.1', port=0, **ui_server.waitress_options)
+        ports.put(server.effective_port)
+        server.run()
+    else:
+        async def run():
+            server = await aio_wsgi.serve(app, host='127.0.0.1', port=0)
+            ports.put(server.sockets[0].getsockname()[1])
+            await asyncio.Event().wait()
+        asyncio.run(run())
+
+
+def client(port, end_time, latencies, errors):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+    i = 0
+    while time.time() < end_time:
+        start = time.perf_counter()
+        try:
+            connection.request('GET', paths[i % len(paths)])
+            response = connection.getresponse()
+            response.read()
+            if response.status != 200:
+                errors.append(response.status)
+        except (OSError, http.client.HTTPException) as e:
+            errors.append(type(e).__name__)
+            connection.close()
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+            continue
+        latencies.append(time.perf_counter() - start)
+        i += 1
+    connection.close()
+
+
+def open_stuck_connections(port, count):
+    stuck = []
+    for i in range(count):
+        sock = socket.create_connection(('127.0.0.1', port))
+        sock.sendall(b'GET / HTTP/1.1\r\nHost: localhost\r\n')  # never finished
+        stuck.append(sock)
+    return stuck
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))] if values else float('nan')
+
+
+def run_mode(mode, clients, seconds, stuck_count):
+    ports = multiprocessing.Queue()
+    server = multiprocessing.Process(target=serve, args=(mode, ports), daemon=True)
+    server.start()
+    port = ports.get()
+    stuck = open_stuck_connections(port, stuck_count)
+    latencies = []
+    errors = []
+    end_time = time.time() + seconds
+    threads = [threading.Thread(target=client, args=(port, end_time, latencies, errors)) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for sock in stuck:
+        sock.close()
+    server.terminate()
+    print('{:<9} {:8.0f} req/s   p50 {:6.1f} ms   p99 {:6.1f} ms   errors {}'.format(
+        mode, len(latencies) / seconds, percentile(latencies, 0.5) * 1000, percentile(latencies, 0.99) * 1000,
+        len(errors)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the web UI serving modes.')
+    parser.add_argument('--modes', default='flask,waitress,asyncio')
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--stuck', type=int, default=0, help='stalled connections held open during the run')
+    args = parser.parse_args()
+    for mode in args.modes.split(','):
+        run_mode(mode, args.clients, args.seconds, args.stuck)
+
+
+if __name__ == '__main__':
+    main()
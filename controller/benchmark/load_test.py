@@ -0,0 +1,276 @@
+"""
+Load test for the controller with many simulated sensor clients.
+A broker (controller.broker unless --broker is given) and the simulated sensors each run in their own process so the
+numbers for this process are the controller's alone. For each client count the sensors publish text payloads like
+client_br for --seconds, while a probe on the roof topic measures the time from publish to the analysis which used
+it. Reports on_message throughput, decision latency, controller CPU and RSS, how busy paho's network thread was and
+how long callers waited on the controller lock, and flags the first client count where the controller falls behind.
+Run from the repository root: python -m controller.benchmark.load_test --clients 50,100,200,400
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import resource
+import struct
+import tempfile
+import threading
+import time
+
+from common.common import *
+from controller import broker
+from controller import controller
+from controller import zones
+
+
+first_sensor_topic = 100
+probe_period_seconds = 0.5
+probe_base_temp = 10.0  # probe n reports probe_base_temp + n / 100 so the analysis can tell which it saw
+drain_seconds = 2
+saturated_delivery = 0.99  # fraction of sent messages handled by the end of the run
+saturated_busy = 0.9  # fraction of wall time paho's thread spent on CPU
+
+
+class TimedLock:
+    # Wraps the controller lock to measure how long callers wait for it.
+    def __init__(self, lock):
+        self._lock = lock
+        self.wait_ns = 0
+        self.max_wait_ns = 0
+        self.acquisitions = 0
+
+    def acquire(self):
+        start = time.perf_counter_ns()
+        result = self._lock.acquire()
+        waited = time.perf_counter_ns() - start
+        self.wait_ns += waited
+        self.max_wait_ns = max(self.max_wait_ns, waited)
+        self.acquisitions += 1
+        return result
+
+    def release(self):
+        self._lock.release()
+
+
+class LoadTestController(controller.Controller):
+    def __init__(self):
+        super().__init__(web_server=False)
+        self.lock = TimedLock(self.lock)
+        self.probes_seen = {}
+        self.paho_thread_time = None  # (first, last) thread CPU time seen in on_message
+
+    def on_message(self, mqttc, obj, msg):
+        thread_time = time.thread_time()
+        if self.paho_thread_time is None:
+            self.paho_thread_time = [thread_time, thread_time]
+        else:
+            self.paho_thread_time[1] = thread_time
+        super().on_message(mqttc, obj, msg)
+
+    def analyse_state(self):
+        super().analyse_state()
+        temp = self.climate_state.roof_data.get_temp()
+        if temp is not None:
+            probe = round((temp - probe_base_temp) * 100)
+            self.probes_seen.setdefault(probe, time.time())
+
+
+def write_zones(path, clients):
+    # the three default rooms plus one zone per simulated client, keeping the roof topic for the probe
+    extra = [{'name': 'sensor{}'.format(i), 'topic': first_sensor_topic + i,
+              'role': zones.Roles.LIVING if i % 2 else zones.Roles.BEDROOM} for i in range(clients)]
+    default = [{'name': z.name, 'topic': z.topic, 'role': z.role} for z in zones.default_zones]
+    with open(path, 'w') as f:
+        json.dump(default + extra, f)
+
+
+def connect_packet(client_id):
+    body = broker.encode_string(b'MQTT') + bytes([4, 0x02]) + struct.pack('!H', 60) + broker.encode_string(client_id)
+    return broker.make_packet(broker.CONNECT, 0, body)
+
+
+async def open_client(host, port, client_id):
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(connect_packet(client_id))
+    packet_type, flags, body = await broker.read_packet(reader)
+    if packet_type != broker.CONNACK or body[1] != broker.connack_accepted:
+        raise ConnectionError('connection refused: ' + str(body))
+    return reader, writer
+
+
+async def run_sensor(host, port, index, rate, start_time, end_time, sent):
+    reader, writer = await open_client(host, port, 'load-sensor-{}'.format(index).encode())
+    topic = str(first_sensor_topic + index).encode()
+    rng = random.Random(index)
+    temp = 20 + rng.uniform(-2, 2)
+    humidity = 50 + rng.uniform(-10, 10)
+    period = 1 / rate
+    next_time = start_time + rng.uniform(0, period)  # spread clients across the period
+    while next_time < end_time:
+        await asyncio.sleep(max(0.0, next_time - time.time()))
+        temp += rng.uniform(-0.05, 0.05)
+        writer.write(broker.make_publish(topic, '{:.2f} {:.2f}'.format(temp, humidity).encode(), 0, False))
+        sent[0] += 1
+        next_time += period
+        if writer.transport.get_write_buffer_size() > broker.max_write_buffer_bytes:
+            await writer.drain()
+    await writer.drain()
+    writer.close()
+
+
+async def run_probe(host, port, start_time, end_time, probes):
+    reader, writer = await open_client(host, port, b'load-probe')
+    topic = str(Topic.ROOF_TEMP_HUM).encode()
+    probe = 0
+    await asyncio.sleep(max(0.0, start_time - time.time()))
+    while time.time() < end_time:
+        probe += 1
+        payload = '{:.2f} 40.00'.format(probe_base_temp + probe / 100).encode()
+        probes.append((probe, time.time()))
+        writer.write(broker.make_publish(topic, payload, 0, False))
+        await writer.drain()
+        await asyncio.sleep(probe_period_seconds)
+    writer.close()
+
+
+def load_process(host, port, clients, rate, seconds, results):
+    async def run():
+        start_time = time.time() + 1 + clients / 500  # time to connect every client
+        end_time = start_time + seconds
+        sent = [0]
+        probes = []
+        await asyncio.gather(run_probe(host, port, start_time, end_time, probes),
+                             *[run_sensor(host, port, i, rate, start_time, end_time, sent) for i in range(clients)])
+        results.put((start_time, end_time, sent[0], probes))
+    asyncio.run(run())
+
+
+def broker_process(ports):
+    async def run():
+        mqtt_broker = broker.Broker('127.0.0.1', 0)
+        await mqtt_broker.start()
+        ports.put(mqtt_broker.port)
+        await asyncio.Event().wait()
+    asyncio.run(run())
+
+
+def rss_kb():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def percentile(values, fraction):
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def run_level(host, port, clients, rate, seconds, debounce):
+    with tempfile.TemporaryDirectory() as directory:
+        zones_path = os.path.join(directory, 'zones.json')
+        write_zones(zones_path, clients)
+        LoadTestController.zones_path = zones_path
+        core = LoadTestController()
+    core.debounce_seconds = debounce
+    core.enabled = False  # decisions are still made, but the load test has no roof node to command
+    core.connect(host, port)
+    core.loop_start()
+    stop = threading.Event()
+
+    def analysis_loop():
+        while not stop.is_set():
+            core.wait_for_analysis_due()
+            core.analyse_state()
+    analysis_thread = threading.Thread(target=analysis_loop, daemon=True)
+    analysis_thread.start()
+
+    results = multiprocessing.Queue()
+    load = multiprocessing.Process(target=load_process, args=(host, port, clients, rate, seconds, results))
+    usage_before = resource.getrusage(resource.RUSAGE_SELF)
+    load.start()
+    start_time, end_time, sent, probes = results.get()
+    handled_at_end = sum(stats.calls for stats in core.router.stats.values())
+    usage_after = resource.getrusage(resource.RUSAGE_SELF)
+    time.sleep(drain_seconds)
+    load.join()
+    stop.set()
+    core.notify_inputs_changed()
+    analysis_thread.join()
+    core.disconnect()
+    core.loop_stop()
+
+    wall = end_time - start_time
+    sent += len(probes)
+    latencies = [core.probes_seen[probe] - sent_time for probe, sent_time in probes if probe in core.probes_seen]
+    cpu = (usage_after.ru_utime + usage_after.ru_stime) - (usage_before.ru_utime + usage_before.ru_stime)
+    paho_busy = 0.0
+    if core.paho_thread_time is not None:
+        paho_busy = (core.paho_thread_time[1] - core.paho_thread_time[0]) / wall
+    handler_us = [stats.mean_us for stats in core.router.stats.values() if stats.calls]
+    return {
+        'clients': clients,
+        'offered': sent / wall,
+        'handled': handled_at_end / wall,
+        'delivery': handled_at_end / sent if sent else 0.0,
+        'handler_us': sum(handler_us) / len(handler_us) if handler_us else 0.0,
+        'latency_p50': percentile(latencies, 0.5),
+        'latency_p95': percentile(latencies, 0.95),
+        'probes_lost': len(probes) - len(latencies),
+        'cpu': cpu / wall,
+        'rss_mb': rss_kb() / 1024,
+        'paho_busy': paho_busy,
+        'lock_wait_ms': core.lock.wait_ns / 1e6,
+        'lock_max_ms': core.lock.max_wait_ns / 1e6,
+        'dropped': core.router.unknown + core.router.malformed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the controller with simulated sensor clients.')
+    parser.add_argument('--clients', default='50,100,200,400,800', help='comma separated client counts')
+    parser.add_argument('--rate', type=float, default=2.0, help='messages per second per client')
+    parser.add_argument('--seconds', type=float, default=10.0, help='duration of each level')
+    parser.add_argument('--debounce', type=float, default=controller.Controller.debounce_seconds)
+    parser.add_argument('--broker', help='host:port of an existing broker, otherwise controller.broker is started')
+    args = parser.parse_args()
+
+    broker_proc = None
+    if args.broker:
+        host, _, port = args.broker.partition(':')
+        port = int(port or broker.default_port)
+    else:
+        host = '127.0.0.1'
+        ports = multiprocessing.Queue()
+        broker_proc = multiprocessing.Process(target=broker_process, args=(ports,), daemon=True)
+        broker_proc.start()
+        port = ports.get()
+
+    print('{:>7} {:>9} {:>9} {:>8} {:>8} {:>9} {:>9} {:>6} {:>6} {:>7} {:>6} {:>9}'.format(
+        'clients', 'offered/s', 'handled/s', 'delivery', 'msg us', 'p50 ms', 'p95 ms', 'cpu', 'paho', 'rss MB',
+        'lost', 'lock ms'))
+    saturation = None
+    try:
+        for clients in [int(c) for c in args.clients.split(',')]:
+            r = run_level(host, port, clients, args.rate, args.seconds, args.debounce)
+            print('{clients:>7} {offered:>9.0f} {handled:>9.0f} {delivery:>8.1%} {handler_us:>8.1f} '
+                  '{p50:>9.0f} {p95:>9.0f} {cpu:>6.0%} {paho_busy:>6.0%} {rss_mb:>7.1f} {probes_lost:>6} '
+                  '{lock_wait_ms:>9.1f}'.format(p50=r['latency_p50'] * 1000, p95=r['latency_p95'] * 1000, **r))
+            if saturation is None and (r['delivery'] < saturated_delivery or r['paho_busy'] > saturated_busy):
+                saturation = clients
+    finally:
+        if broker_proc is not None:
+            broker_proc.terminate()
+    if saturation is None:
+        print('controller kept up at every level')
+    else:
+        print('controller saturated at {} clients ({:.0f} msg/s offered)'.format(saturation, saturation * args.rate))
+
+
+if __name__ == '__main__':
+    main()
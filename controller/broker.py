@@ -0,0 +1,402 @@
+"""
+Small MQTT 3.1.1 broker on asyncio, enough for this system's clients.
+Supports QoS 0 and 1, retained messages, + and # wildcards, last wills and keep alive. Sessions are always clean
+and QoS 1 messages are not redelivered after a reconnect, so it is a stand in for tests and single box installs
+rather than a general purpose broker.
+Run standalone with python -m controller.broker, or set Controller.embedded_broker to run it inside the controller.
+"""
+
+import argparse
+import asyncio
+import struct
+import threading
+
+
+default_port = 1883
+connect_timeout_seconds = 10
+max_packet_bytes = 256 * 1024
+max_write_buffer_bytes = 64 * 1024  # QoS 0 messages are dropped for a subscriber this far behind
+
+CONNECT = 1
+CONNACK = 2
+PUBLISH = 3
+PUBACK = 4
+SUBSCRIBE = 8
+SUBACK = 9
+UNSUBSCRIBE = 10
+UNSUBACK = 11
+PINGREQ = 12
+PINGRESP = 13
+DISCONNECT = 14
+
+connack_accepted = 0
+connack_bad_protocol = 1
+connack_bad_client_id = 2
+subscription_failure = 0x80
+
+
+class ProtocolError(Exception):
+    pass
+
+
+def encode_length(length):
+    out = bytearray()
+    while True:
+        byte = length % 128
+        length //= 128
+        if length:
+            byte |= 0x80
+        out.append(byte)
+        if not length:
+            return bytes(out)
+
+
+def encode_string(value):
+    return struct.pack('!H', len(value)) + value
+
+
+def decode_string(body, offset):
+    if offset + 2 > len(body):
+        raise ProtocolError('truncated string')
+    length, = struct.unpack_from('!H', body, offset)
+    end = offset + 2 + length
+    if end > len(body):
+        raise ProtocolError('truncated string')
+    return body[offset + 2:end], end
+
+
+def make_packet(packet_type, flags, body):
+    return bytes([packet_type << 4 | flags]) + encode_length(len(body)) + body
+
+
+def make_publish(topic, payload, qos, retain, packet_id=None):
+    body = encode_string(topic)
+    if qos:
+        body += struct.pack('!H', packet_id)
+    return make_packet(PUBLISH, qos << 1 | int(retain), body + payload)
+
+
+async def read_packet(reader):
+    first = (await reader.readexactly(1))[0]
+    length = 0
+    multiplier = 1
+    for i in range(4):
+        byte = (await reader.readexactly(1))[0]
+        length += (byte & 0x7F) * multiplier
+        if not byte & 0x80:
+            break
+        multiplier *= 128
+    else:
+        raise ProtocolError('bad remaining length')
+    if length > max_packet_bytes:
+        raise ProtocolError('packet too large')
+    body = await reader.readexactly(length) if length else b''
+    return first >> 4, first & 0x0F, body
+
+
+def valid_filter(topic_filter):
+    parts = topic_filter.split('/')
+    for i, part in enumerate(parts):
+        if ('#' in part and (part != '#' or i != len(parts) - 1)) or ('+' in part and part != '+'):
+            return False
+    return bool(topic_filter)
+
+
+def filter_matches(filter_parts, topic_parts):
+    if topic_parts[0].startswith('$') and filter_parts[0] in ('+', '#'):
+        return False  # wildcards don't match system topics
+    for i, part in enumerate(filter_parts):
+        if part == '#':
+            return True
+        if i >= len(topic_parts) or (part != '+' and part != topic_parts[i]):
+            return False
+    return len(filter_parts) == len(topic_parts)
+
+
+class Session:
+    def __init__(self, client_id, writer, keepalive, will):
+        self.client_id = client_id
+        self.writer = writer
+        self.keepalive = keepalive
+        self.will = will  # (topic, payload, qos, retain) or None
+        self.subscriptions = {}  # filter -> qos
+        self._packet_id = 0
+
+    def next_packet_id(self):
+        self._packet_id = self._packet_id % 0xFFFF + 1
+        return self._packet_id
+
+    def send(self, packet):
+        self.writer.write(packet)
+
+    def backlogged(self):
+        transport = self.writer.transport
+        return transport is not None and transport.get_write_buffer_size() > max_write_buffer_bytes
+
+
+class Broker:
+    def __init__(self, host='127.0.0.1', port=default_port):
+        self.host = host
+        self.port = port
+        self.sessions = {}  # client id -> Session
+        self.retained = {}  # topic -> (payload, qos)
+        self._exact = {}  # topic -> {session: qos}, filters without wildcards
+        self._wildcard = {}  # filter -> (parts, {session: qos})
+        self._server = None
+        self._loop = None
+        self.messages_received = 0
+        self.messages_sent = 0
+        self.messages_dropped = 0
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]  # resolves port 0
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+        for session in list(self.sessions.values()):
+            session.will = None
+            session.writer.close()
+
+    async def _handle_connection(self, reader, writer):
+        session = None
+        try:
+            packet_type, flags, body = await asyncio.wait_for(read_packet(reader), connect_timeout_seconds)
+            if packet_type != CONNECT:
+                return
+            session = self._connect(body, writer)
+            if session is None:
+                return
+            timeout = session.keepalive * 1.5 if session.keepalive else None
+            while True:
+                packet_type, flags, body = await asyncio.wait_for(read_packet(reader), timeout)
+                if packet_type == PUBLISH:
+                    self._receive_publish(session, flags, body)
+                elif packet_type == PUBACK:
+                    pass  # nothing is held for redelivery
+                elif packet_type == SUBSCRIBE:
+                    self._subscribe(session, body)
+                elif packet_type == UNSUBSCRIBE:
+                    self._unsubscribe(session, body)
+                elif packet_type == PINGREQ:
+                    session.send(make_packet(PINGRESP, 0, b''))
+                elif packet_type == DISCONNECT:
+                    session.will = None
+                    break
+                else:
+                    break
+                await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError, ProtocolError, struct.error,
+                UnicodeDecodeError):
+            pass
+        finally:
+            if session is not None:
+                self._disconnect(session)
+            writer.close()
+
+    def _connect(self, body, writer):
+        protocol, offset = decode_string(body, 0)
+        if offset + 4 > len(body):
+            raise ProtocolError('truncated connect')
+        level, flags, keepalive = struct.unpack_from('!BBH', body, offset)
+        if (protocol, level) not in ((b'MQTT', 4), (b'MQIsdp', 3)):
+            writer.write(make_packet(CONNACK, 0, bytes([0, connack_bad_protocol])))
+            return None
+        client_id, offset = decode_string(body, offset + 4)
+        will = None
+        if flags & 0x04:
+            will_topic, offset = decode_string(body, offset)
+            will_payload, offset = decode_string(body, offset)
+            will = (will_topic.decode(), will_payload, min((flags >> 3) & 0x03, 1), bool(flags & 0x20))
+        # username and password are accepted and ignored
+        client_id = client_id.decode()
+        if not client_id:
+            if not flags & 0x02:
+                writer.write(make_packet(CONNACK, 0, bytes([0, connack_bad_client_id])))
+                return None
+            client_id = 'anonymous-{}'.format(id(writer))
+        previous = self.sessions.get(client_id)
+        if previous is not None:
+            self._disconnect(previous)  # takeover, the old connection's will is sent
+            previous.writer.close()
+        session = Session(client_id, writer, keepalive, will)
+        self.sessions[client_id] = session
+        writer.write(make_packet(CONNACK, 0, bytes([0, connack_accepted])))
+        return session
+
+    def _disconnect(self, session):
+        if self.sessions.get(session.client_id) is not session:
+            return
+        del self.sessions[session.client_id]
+        for topic_filter in list(session.subscriptions):
+            self._remove_subscription(session, topic_filter)
+        if session.will is not None:
+            topic, payload, qos, retain = session.will
+            session.will = None
+            self.publish(topic, payload, qos, retain)
+
+    def _receive_publish(self, session, flags, body):
+        qos = (flags >> 1) & 0x03
+        if qos > 1:
+            raise ProtocolError('QoS 2 is not supported')
+        topic, offset = decode_string(body, 0)
+        if qos:
+            if offset + 2 > len(body):
+                raise ProtocolError('truncated publish')
+            packet_id, = struct.unpack_from('!H', body, offset)
+            offset += 2
+            session.send(make_packet(PUBACK, 0, struct.pack('!H', packet_id)))
+        topic = topic.decode()
+        if not topic or '+' in topic or '#' in topic:
+            raise ProtocolError('bad topic')
+        self.messages_received += 1
+        self.publish(topic, body[offset:], qos, bool(flags & 0x01))
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        """
+        Delivers a message to every matching subscriber. Must be called on the broker's event loop.
+        """
+        if retain:
+            if payload:
+                self.retained[topic] = (payload, qos)
+            else:
+                self.retained.pop(topic, None)
+        recipients = dict(self._exact.get(topic, ()))
+        if self._wildcard:
+            topic_parts = topic.split('/')
+            for parts, subscribers in self._wildcard.values():
+                if filter_matches(parts, topic_parts):
+                    for session, granted in subscribers.items():
+                        if granted > recipients.get(session, -1):
+                            recipients[session] = granted
+        encoded_topic = topic.encode()
+        shared_packet = None  # QoS 0 packets are identical for every subscriber
+        for session, granted in recipients.items():
+            if min(qos, granted):
+                session.send(make_publish(encoded_topic, payload, 1, False, session.next_packet_id()))
+            elif session.backlogged():
+                self.messages_dropped += 1
+                continue
+            else:
+                if shared_packet is None:
+                    shared_packet = make_publish(encoded_topic, payload, 0, False)
+                session.send(shared_packet)
+            self.messages_sent += 1
+
+    def _subscribe(self, session, body):
+        packet_id, = struct.unpack_from('!H', body, 0)
+        offset = 2
+        codes = bytearray()
+        new_filters = []
+        while offset < len(body):
+            topic_filter, offset = decode_string(body, offset)
+            if offset >= len(body):
+                raise ProtocolError('truncated subscribe')
+            requested = body[offset] & 0x03
+            offset += 1
+            topic_filter = topic_filter.decode()
+            if not valid_filter(topic_filter):
+                codes.append(subscription_failure)
+                continue
+            granted = min(requested, 1)
+            self._remove_subscription(session, topic_filter)
+            session.subscriptions[topic_filter] = granted
+            if '+' in topic_filter or '#' in topic_filter:
+                self._wildcard.setdefault(topic_filter, (topic_filter.split('/'), {}))[1][session] = granted
+            else:
+                self._exact.setdefault(topic_filter, {})[session] = granted
+            codes.append(granted)
+            new_filters.append((topic_filter.split('/'), granted))
+        if not codes:
+            raise ProtocolError('empty subscribe')
+        session.send(make_packet(SUBACK, 0, struct.pack('!H', packet_id) + codes))
+        for topic, (payload, qos) in self.retained.items():
+            topic_parts = topic.split('/')
+            granted = max((g for parts, g in new_filters if filter_matches(parts, topic_parts)), default=None)
+            if granted is not None:
+                qos = min(qos, granted)
+                session.send(make_publish(topic.encode(), payload, qos, True, session.next_packet_id() if qos else None))
+                self.messages_sent += 1
+
+    def _unsubscribe(self, session, body):
+        packet_id, = struct.unpack_from('!H', body, 0)
+        offset = 2
+        while offset < len(body):
+            topic_filter, offset = decode_string(body, offset)
+            self._remove_subscription(session, topic_filter.decode())
+        session.send(make_packet(UNSUBACK, 0, struct.pack('!H', packet_id)))
+
+    def _remove_subscription(self, session, topic_filter):
+        if session.subscriptions.pop(topic_filter, None) is None:
+            return
+        if topic_filter in self._wildcard:
+            subscribers = self._wildcard[topic_filter][1]
+            subscribers.pop(session, None)
+            if not subscribers:
+                del self._wildcard[topic_filter]
+        else:
+            subscribers = self._exact[topic_filter]
+            subscribers.pop(session, None)
+            if not subscribers:
+                del self._exact[topic_filter]
+
+
+class BrokerThread:
+    # Runs a Broker on its own event loop for the threaded controller and tests.
+    def __init__(self, host='127.0.0.1', port=default_port):
+        self.broker = Broker(host, port)
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._started = threading.Event()
+        self._error = None
+
+    @property
+    def port(self):
+        return self.broker.port
+
+    def start(self):
+        self._thread.start()
+        self._started.wait()
+        if self._error is not None:
+            raise self._error
+        return self
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        self._loop.call_soon_threadsafe(self.broker.publish, topic, payload, qos, retain)
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self.broker.stop(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+    def _run(self):
+        asyncio.set_event_loop(self._loop)
+        try:
+            self._loop.run_until_complete(self.broker.start())
+        except OSError as e:
+            self._error = e
+            return
+        finally:
+            self._started.set()
+        self._loop.run_forever()
+        self._loop.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the MQTT broker on its own.')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=default_port)
+    args = parser.parse_args()
+
+    async def run():
+        broker = Broker(args.host, args.port)
+        await broker.start()
+        print('mqtt broker listening on {}:{}'.format(args.host, broker.port))
+        await asyncio.Event().wait()
+    asyncio.run(run())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+"""
+Crash safe checkpoints of the controller's state so a restart carries on where it left off.
+A checkpoint is a small json file holding the user's settings, the hardware state and when it was entered, the
+desired actuator values and the last reading from each zone with its timestamp. It is written to a temporary file,
+synced and renamed over the previous one, so a power cut leaves either the old or the new checkpoint and never a
+partial one. Readings keep their original timestamps, so anything older than stale_after_seconds is still stale
+after a restore.
+"""
+
+import json
+import logging
+import os
+
+
+version = 1
+checkpoint_period_seconds = 60
+logger = logging.getLogger(__name__)
+
+
+def save(path, state):
+    data = json.dumps(dict(state, version=version), separators=(',', ':')).encode()
+    temporary_path = path + '.tmp'
+    with open(temporary_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary_path, path)
+    directory = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(directory)  # makes the rename itself durable
+    finally:
+        os.close(directory)
+
+
+def load(path):
+    """
+    Returns the saved state, or None if there is no usable checkpoint.
+    """
+    try:
+        with open(path, 'rb') as f:
+            state = json.loads(f.read().decode())
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning('ignoring unreadable checkpoint %s: %s', path, e)
+        return None
+    if not isinstance(state, dict) or state.get('version') != version:
+        logger.warning('ignoring checkpoint %s with unknown version', path)
+        return None
+    return state
@@ -0,0 +1,54 @@
+"""
+Source of the current time for the control logic.
+Everything that makes time based decisions calls clock.time() or clock.now() so the simulator can replace the
+system clock with a VirtualClock and replay long traces without waiting.
+"""
+
+import datetime
+import time as _time
+
+
+class SystemClock:
+    def time(self):
+        return _time.time()
+
+    def now(self):
+        return datetime.datetime.now()
+
+
+class VirtualClock:
+    def __init__(self, start_time=0.0):
+        self.current_time = start_time
+
+    def time(self):
+        return self.current_time
+
+    def now(self):
+        return datetime.datetime.fromtimestamp(self.current_time)
+
+    def advance(self, seconds):
+        self.current_time += seconds
+
+    def set(self, timestamp):
+        self.current_time = timestamp
+
+
+_clock = SystemClock()
+
+
+def time():
+    return _clock.time()
+
+
+def now():
+    return _clock.now()
+
+
+def set_clock(clock):
+    """
+    Replaces the clock used by the control logic and returns the previous one.
+    """
+    global _clock
+    previous = _clock
+    _clock = clock
+    return previous
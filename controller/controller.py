@@ -1,19 +1,97 @@
+import collections
+import functools
+import logging
+import os
+import struct
 import threading
 import time
 
 from paho.mqtt import client as mqtt
 
+from . import actuators
+from . import checkpoint
+from . import clock
 from . import event_selector
 from . import hardware_state_machine
+from . import history
+from . import log
+from . import message_router
+from . import metrics
+from . import zones
 from common.common import *
-from web_ui import ui_server
+
+
+default_history_dir = os.path.join(os.path.expanduser('~'), 'ventilation_history')
+default_checkpoint_path = os.path.join(os.path.expanduser('~'), 'ventilation_checkpoint.json')
+logger = logging.getLogger(__name__)
+message_logger = logging.getLogger(log.message_logger_name)
+default_broker_port = 1883  # same as broker.default_port, which isn't imported unless the broker is embedded
+subscription_topic = '+'  # every topic is a single level, handlers are picked by MessageRouter
+
+
+min_temp, max_temp = -40.0, 125.0  # SHT30 measurement limits
+min_humidity, max_humidity = 0.0, 100.0
+# Sensors only publish on change or heartbeat, so a quiet sensor is stable rather than stale until it misses two.
+# One lost qos 0 heartbeat is tolerated, the heartbeat is checked once per sample period.
+stale_after_seconds = 2 * heartbeat_period_seconds + sensor_sample_period_seconds
+first_printable = 0x20  # binary payloads start with a PayloadFormat byte below this
+min_device_time = 1577836800  # 2020, an earlier reading time means the sensor's clock was never set
+payload_structs = {payload_format: struct.Struct(layout) for payload_format, layout in payload_layouts.items()}
 
 
 class RoomData:
-    def __init__(self, bytes_string):
-        temp_bs, hum_bs = bytes_string.split()
-        self.temp = float(temp_bs)
-        self.humidity = float(hum_bs)
+    __slots__ = ('temp', 'humidity', 'sequence', 'firmware', 'timestamp')
+
+    def __init__(self, payload):
+        # Accepts any PayloadFormat. Raises ValueError for anything else or readings out of range.
+        # timestamp is the unix time the sensor took the reading, None if the payload doesn't say.
+        self.sequence = self.firmware = self.timestamp = None
+        if payload and payload[0] < first_printable:
+            payload_format = payload[0]
+            payload_struct = payload_structs.get(payload_format)
+            if payload_struct is None or len(payload) != payload_struct.size:
+                raise ValueError('bad binary payload: format {} length {}'.format(payload_format, len(payload)))
+            if payload_format == PayloadFormat.CENTI:
+                _, temp, humidity = payload_struct.unpack(payload)
+            elif payload_format == PayloadFormat.CENTI_TIME:
+                _, self.firmware, self.sequence, timestamp, temp, humidity = payload_struct.unpack(payload)
+                self.timestamp = timestamp or None  # 0 before the sensor's clock is set
+            else:
+                _, self.firmware, self.sequence, temp, humidity = payload_struct.unpack(payload)
+            if payload_format == PayloadFormat.RAW_SHT30:
+                temp = sht30_celsius(temp)
+                humidity = sht30_humidity(humidity)
+            else:
+                temp /= 100
+                humidity /= 100
+        else:
+            fields = payload.split()  # one split, the reading time is the optional third field
+            if len(fields) == 2:
+                temp_bs, hum_bs = fields
+            else:
+                temp_bs, hum_bs, time_bs = fields
+                self.timestamp = int(time_bs)
+            temp = float(temp_bs)
+            humidity = float(hum_bs)
+        # written so NaN fails the checks
+        if not min_temp <= temp <= max_temp:
+            raise ValueError('temperature out of range: ' + repr(temp))
+        if not min_humidity <= humidity <= max_humidity:
+            raise ValueError('humidity out of range: ' + repr(humidity))
+        if self.timestamp is not None and self.timestamp < min_device_time:
+            raise ValueError('reading time before the sensor clock was set: ' + repr(self.timestamp))
+        self.temp = temp
+        self.humidity = humidity
+
+    @classmethod
+    def from_values(cls, temp, humidity, sequence=None, firmware=None, timestamp=None):
+        room_data = cls.__new__(cls)
+        room_data.temp = temp
+        room_data.humidity = humidity
+        room_data.sequence = sequence
+        room_data.firmware = firmware
+        room_data.timestamp = timestamp
+        return room_data
 
 
 class DatedData:
@@ -30,11 +108,14 @@ class DatedData:
 
     @data.setter
     def data(self, value):
+        self.set(value, clock.time())
+
+    def set(self, value, timestamp):
         self._data = value
-        self.timestamp = time.time()
+        self.timestamp = timestamp
 
     def is_fresh(self):
-        return time.time() - self.timestamp < sleep_period_seconds * 2  # allow one missed report
+        return clock.time() - self.timestamp < stale_after_seconds
 
     def get_temp(self):
         d = self.data
@@ -49,119 +130,371 @@ class DatedData:
         return d
 
 
+class RoleData:
+    # Combined view of every zone with one role, the mean of those with fresh data.
+    def __init__(self, members):
+        self.members = members
+
+    def is_fresh(self):
+        return all([d.is_fresh() for d in self.members])
+
+    def get_temp(self):
+        return self._mean([d.get_temp() for d in self.members])
+
+    def get_humidity(self):
+        return self._mean([d.get_humidity() for d in self.members])
+
+    @staticmethod
+    def _mean(values):
+        values = [v for v in values if v is not None]
+        if not values:
+            return None
+        return sum(values) / len(values)
+
+
 class ClimateState:
-    def __init__(self):
-        self.bdrm_data = DatedData()
-        self.lvrm_data = DatedData()
-        self.roof_data = DatedData()
+    def __init__(self, history_store=None, zone_registry=None):
+        self.history = history_store if history_store is not None else history.HistoryStore()
+        self.zone_registry = zone_registry if zone_registry is not None else zones.ZoneRegistry()
+        self.zone_data = {zone.name: DatedData() for zone in self.zone_registry.zones}
+        self._topic_index = {zone.topic: (zone.name, self.zone_data[zone.name])
+                             for zone in self.zone_registry.zones}
+        self.bdrm_data = self._role_data(zones.Roles.BEDROOM)
+        self.lvrm_data = self._role_data(zones.Roles.LIVING)
+        self.roof_data = self._role_data(zones.Roles.ROOF)
         self.outside_temp = DatedData()  # not used yet
 
+    def _role_data(self, role):
+        members = [self.zone_data[zone.name] for zone in self.zone_registry.by_role[role]]
+        if len(members) == 1:
+            return members[0]
+        return RoleData(members)
+
     def is_fresh(self):
-        return all([self.lvrm_data.is_fresh(), self.roof_data.is_fresh(), self.bdrm_data.is_fresh()])
+        return all([d.is_fresh() for d in self.zone_data.values()])
 
     def process_update(self, topic, payload):
-        if topic == Topic.BR_TEMP_HUM:
-            self.bdrm_data.data = RoomData(payload)
-        if topic == Topic.LR_TEMP_HUM:
-            self.lvrm_data.data = RoomData(payload)
-        if topic == Topic.ROOF_TEMP_HUM:
-            self.roof_data.data = RoomData(payload)
+        # Readings are dated by the sensor when they say when they were taken, so a retained reading delivered on
+        # (re)connect is only fresh if it is recent. The sensor's retained last will marks it stale straight away.
+        entry = self._topic_index.get(topic)
+        if entry is not None:
+            sensor, dated_data = entry
+            if payload == offline_payload:
+                dated_data.set(None, 0)
+                return
+            room_data = RoomData(payload)
+            now = clock.time()
+            timestamp = now if room_data.timestamp is None else min(room_data.timestamp, now)
+            if timestamp <= dated_data.timestamp:
+                return False  # not newer than the reading we have, e.g. a retained copy redelivered on reconnect
+            dated_data.set(room_data, timestamp)
+            self.history.append(sensor, timestamp, room_data.temp, room_data.humidity)
+
+
+# Immutable view of the controller for the web UI, replaced as a whole so readers never need the lock.
+Snapshot = collections.namedtuple('Snapshot', ['target_temperature', 'enabled', 'hard_flush_requested', 'state',
+                                               'roof_temp', 'roof_humidity', 'lvrm_temp', 'lvrm_humidity',
+                                               'bdrm_temp', 'bdrm_humidity'])
 
 
 class Controller(mqtt.Client):
-    def __init__(self):
+    event_driven = True  # analyse as soon as inputs change rather than only on the periodic tick
+    debounce_seconds = 0.5  # bursts of input changes within this period are coalesced into one analysis
+    compiled_state_machine = False  # use the precompiled transition table instead of the transitions package
+    event_selector_parameters_path = None  # json of tuned EventSelector thresholds, e.g. from controller.optimiser
+    zones_path = None  # json list of zones, the three default rooms if None
+    embedded_broker = False  # run controller.broker in process instead of relying on a separate broker
+    web_server_mode = 'waitress'  # or 'flask' for Flask's development server
+
+    def __init__(self, history_dir=None, checkpoint_path=None, web_server=True):
+        # web_server False constructs the controller without the UI thread, for tests and tools
         self.broker_address = '127.0.0.1'
-        self.hardware_state = hardware_state_machine.HardwareState()
-        self.climate_state = ClimateState()
+        self.broker_port = default_broker_port
+        self.broker = None
+        if self.compiled_state_machine:
+            self.hardware_state = hardware_state_machine.CompiledHardwareState()
+        else:
+            self.hardware_state = hardware_state_machine.HardwareState()
+        zone_registry = zones.ZoneRegistry.load(self.zones_path) if self.zones_path is not None else None
+        self.climate_state = ClimateState(history.HistoryStore(history_dir), zone_registry)
+        self.router = message_router.MessageRouter()
+        for zone in self.climate_state.zone_registry.zones:
+            self.router.register(str(zone.topic), functools.partial(self.climate_state.process_update, zone.topic))
+        self.router.ignore(str(Topic.SET_FAN))  # our own commands come back through the wildcard
+        self.router.ignore(str(Topic.SET_VALVES))
+        self.fan = actuators.Actuator('fan', Topic.SET_FAN)
+        self.valves = actuators.Actuator('valves', Topic.SET_VALVES)
+        self.pending_fan = None  # fan speed held back until the valves report the position they were sent
+        self.router.register(str(Topic.FAN_STATE), self.process_fan_state)
+        self.router.register(str(Topic.VALVE_STATE), self.process_valve_state)
+        self.metrics = metrics.ControllerMetrics(self)
         self.event_selector = event_selector.EventSelector()
+        if self.event_selector_parameters_path is not None:
+            self.event_selector.load_parameters(self.event_selector_parameters_path)
         self.target_temperature = 21
         self._hard_flush_requested = False  # locks used as reads and writes from both flask and controller threads
         self.enabled = True
         super().__init__()
+        self.enable_logger(logging.getLogger('controller.mqtt'))  # paho's own log lines, mostly DEBUG
         self.lock = threading.RLock()
-        thread = threading.Thread(target=self.start_web_server, args=())
-        thread.start()
+        self._inputs_changed = threading.Event()
+        self.checkpoint_path = checkpoint_path
+        self._last_checkpoint_time = clock.time()
+        if checkpoint_path is not None:
+            self.restore_checkpoint(checkpoint.load(checkpoint_path))
+        self.snapshot = None
+        self.snapshot_published = threading.Condition()  # wakes the web page's event streams
+        self.publish_snapshot()
+        if web_server:
+            thread = threading.Thread(target=self.start_web_server, args=())
+            thread.start()
 
     def _lock(func):
         def wrapper(self, *args, **kwargs):
+            start = time.perf_counter()
             self.lock.acquire()
-            r = func(self, *args, **kwargs)
-            self.lock.release()
-            return r
+            try:
+                self.metrics.lock_wait_seconds.observe(time.perf_counter() - start)
+                return func(self, *args, **kwargs)
+            finally:
+                self.lock.release()  # handlers raise on bad payloads and must not leave the lock held
         return wrapper
 
     def on_connect(self, mqttc, obj, flags, rc):
-        print("rc: "+str(rc))
+        logger.info('connected to broker, rc %s', rc)
         # Subscribing in on_connect() means that if we lose the connection and
         # reconnect then subscriptions will be renewed.
-        self.subscribe(str(Topic.BR_TEMP_HUM))
-        self.subscribe(str(Topic.LR_TEMP_HUM))
-        self.subscribe(str(Topic.ROOF_TEMP_HUM))
+        # The broker replies with every retained reading, which seeds the zones before the sensors next report.
+        self.subscribe(subscription_topic)
 
     def on_message(self, mqttc, obj, msg):
-        print('on_message: ' + msg.topic + " " + str(msg.qos) + " " + str(msg.payload))
-        topic = int(msg.topic)
-        self.climate_state.process_update(topic, msg.payload)
+        message_logger.debug('%s %r', msg.topic, msg.payload)
+        if self.router.dispatch(msg.topic, msg.payload):
+            self.notify_inputs_changed()  # the analysis it triggers publishes a new snapshot
 
     def on_publish(self, client, obj, mid):
-        print("mid: "+str(mid))
+        self.metrics.publish_acknowledged(mid)
+        logger.debug('published mid %s', mid)
 
     def on_subscribe(self, client, obj, mid, granted_qos):
-        print("Subscribed: "+str(mid)+" "+str(granted_qos))
-
-    def on_log(self, client, obj, level, string):
-        print(string)
+        logger.info('subscribed mid %s qos %s', mid, granted_qos)
 
     @_lock
     def analyse_state(self):
+        start = time.perf_counter()
         trigger_str = self.event_selector.select_event(self.enabled, self.climate_state.is_fresh(),
                                                        self.climate_state, self.get_hard_flush_requested(),
                                                        self.target_temperature)
+        self.metrics.events.inc(trigger_str)
+        source = self.hardware_state.state
         trigger_method = getattr(self.hardware_state, trigger_str)
         trigger_method()
+        if self.hardware_state.state != source:
+            self.metrics.transitions.inc(trigger_str, source, self.hardware_state.state)
         while len(self.hardware_state.pending_actions) > 0:
             action = self.hardware_state.pending_actions.popleft()
             self.perform_action(action)
+        self.retry_commands()
         self.set_flush_request_handled()
+        self.publish_snapshot()
+        self.metrics.analysis_seconds.observe(time.perf_counter() - start)
+
+    @_lock
+    def publish_snapshot(self):
+        # called after every analysis and settings change, a single reference assignment publishes it
+        climate = self.climate_state
+        self.snapshot = Snapshot(self.target_temperature, self.enabled, self._hard_flush_requested,
+                                 self.hardware_state.state,
+                                 climate.roof_data.get_temp(), climate.roof_data.get_humidity(),
+                                 climate.lvrm_data.get_temp(), climate.lvrm_data.get_humidity(),
+                                 climate.bdrm_data.get_temp(), climate.bdrm_data.get_humidity())
+        self.notify_snapshot_published()
+
+    def notify_snapshot_published(self):
+        with self.snapshot_published:
+            self.snapshot_published.notify_all()
+
+    def wait_for_snapshot(self, previous, timeout):
+        # returns the snapshot once it isn't previous, or the same one after timeout
+        with self.snapshot_published:
+            self.snapshot_published.wait_for(lambda: self.snapshot is not previous, timeout)
+        return self.snapshot
 
     def perform_action(self, action):
         if action == hardware_state_machine.Actions.FAN_OFF:
-            self.publish(str(Topic.SET_FAN), payload=FanSpeeds.OFF, qos=1)
+            self.command_fan(FanSpeeds.OFF)
         if action == hardware_state_machine.Actions.FAN_LOW:
-            self.publish(str(Topic.SET_FAN), payload=FanSpeeds.LOW, qos=1)
+            self.command_fan(FanSpeeds.LOW)
         if action == hardware_state_machine.Actions.FAN_HIGH:
-            self.publish(str(Topic.SET_FAN), payload=FanSpeeds.HIGH, qos=1)
+            self.command_fan(FanSpeeds.HIGH)
         if action == hardware_state_machine.Actions.VALVES_EXTRACT_ROOF:
-            self.publish(str(Topic.SET_VALVES), payload=ValveStates.extract_from_roof, qos=1)
+            self.command(self.valves, ValveStates.extract_from_roof)
         if action == hardware_state_machine.Actions.VALVES_EXTRACT_LVRM:
-            self.publish(str(Topic.SET_VALVES), payload=ValveStates.extract_from_living, qos=1)
+            self.command(self.valves, ValveStates.extract_from_living)
+
+    def command_fan(self, speed):
+        # the fan is held off while the valves move, so air is never driven through half moved valves
+        if speed != FanSpeeds.OFF and self.valves.desired is not None and not self.valves.converged() \
+                and not self.valves.dead:
+            self.command(self.fan, FanSpeeds.OFF)  # e.g. still running at the old speed from the previous state
+            self.pending_fan = speed
+        else:
+            self.command(self.fan, speed)
+
+    def command(self, actuator, value, qos=1, force=False):
+        # only sends values the actuator doesn't already have, force is for diagnostics
+        if actuator is self.fan:
+            self.pending_fan = None  # superseded, including by a diagnostic button
+        if actuator.set_desired(value) or force:
+            self.publish_command(actuator, value, qos)
+
+    def retry_commands(self):
+        for actuator in (self.fan, self.valves):
+            value = actuator.due_command()
+            if value is not None:
+                self.publish_command(actuator, value, 1)
+
+    def publish_command(self, actuator, value, qos):
+        topic = str(actuator.command_topic)
+        info = self.publish(topic, payload=value, qos=qos)
+        if qos > 0:
+            self.metrics.publish_sent(info, topic)
+        actuator.mark_sent()
+
+    def process_fan_state(self, payload):
+        # validated before taking the lock, anyone on the broker can publish here
+        state = int(payload)
+        if not FanSpeeds.OFF <= state <= FanSpeeds.HIGH:
+            raise ValueError('unknown fan speed: ' + repr(payload))
+        self.report_actuator(self.fan, state)
+
+    def process_valve_state(self, payload):
+        state = int(payload)
+        if not ValveStates.extract_from_living <= state <= ValveStates.unknown:
+            raise ValueError('unknown valve state: ' + repr(payload))
+        self.report_actuator(self.valves, state)
+
+    @_lock
+    def report_actuator(self, actuator, state):
+        actuator.report(state)
+        if actuator is self.valves and self.pending_fan is not None:
+            self.command_fan(self.pending_fan)
+
+    def valves_settled(self):
+        return self.valves.reported in (ValveStates.extract_from_living, ValveStates.extract_from_roof)
+
+    def notify_inputs_changed(self):
+        self._inputs_changed.set()
+
+    def wait_for_analysis_due(self):
+        # Periodic tick keeps timer conditions in the state machine checked when no inputs arrive.
+        if not self.event_driven:
+            time.sleep(sleep_period_seconds)
+            return
+        if self._inputs_changed.wait(timeout=sleep_period_seconds):
+            time.sleep(self.debounce_seconds)  # let the rest of a burst arrive
+        self._inputs_changed.clear()
+
+    @_lock
+    def checkpoint_state(self):
+        hardware_state = self.hardware_state
+        readings = {}
+        for name, dated_data in self.climate_state.zone_data.items():
+            room_data = dated_data.data
+            if room_data is not None:  # stale readings would be stale after a restore too
+                readings[name] = [dated_data.timestamp, room_data.temp, room_data.humidity, room_data.sequence,
+                                  room_data.firmware]
+        return {'target_temperature': self.target_temperature, 'enabled': self.enabled,
+                'hardware_state': [hardware_state.state, hardware_state.state_start_time, hardware_state.flushing,
+                                   hardware_state.hard_flushing],
+                'desired': [self.fan.desired if self.pending_fan is None else self.pending_fan, self.valves.desired],
+                'readings': readings}
+
+    @_lock
+    def restore_checkpoint(self, state):
+        if state is None:
+            return
+        try:  # everything is parsed before anything is applied so a bad checkpoint changes nothing
+            target_temperature = int(state['target_temperature'])
+            enabled = bool(state['enabled'])
+            state_name, state_start_time, flushing, hard_flushing = state['hardware_state']
+            if state_name not in self.hardware_state.states:
+                raise ValueError('unknown state: ' + repr(state_name))
+            state_start_time = float(state_start_time)
+            fan, valves = [None if value is None else int(value) for value in state['desired']]
+            readings = {name: (float(timestamp), RoomData.from_values(float(temp), float(humidity), sequence, firmware))
+                        for name, (timestamp, temp, humidity, sequence, firmware) in state['readings'].items()
+                        if name in self.climate_state.zone_data}
+        except (KeyError, ValueError, TypeError, AttributeError) as e:
+            logger.warning('ignoring bad checkpoint: %r', e)
+            return
+        self.target_temperature = target_temperature
+        self.enabled = enabled
+        self.hardware_state.restore(state_name, state_start_time, bool(flushing), bool(hard_flushing))
+        self.valves.desired = valves  # resent by retry_commands unless the roof client reports them
+        if valves is not None and fan not in (None, FanSpeeds.OFF):
+            self.pending_fan = fan  # released when the retained valve state arrives on connect
+        else:
+            self.fan.desired = fan
+        for name, (timestamp, room_data) in readings.items():
+            self.climate_state.zone_data[name].set(room_data, timestamp)
+        logger.info('restored %s with %d readings in state %s', self.checkpoint_path, len(readings), state_name)
+
+    def save_checkpoint(self, state):
+        self._last_checkpoint_time = clock.time()
+        try:
+            checkpoint.save(self.checkpoint_path, state)
+        except OSError as e:
+            logger.warning('checkpoint failed: %s', e)
+
+    def checkpoint_due(self):
+        return self.checkpoint_path is not None and \
+            clock.time() - self._last_checkpoint_time >= checkpoint.checkpoint_period_seconds
+
+    def checkpoint_if_due(self):
+        if self.checkpoint_due():
+            self.save_checkpoint(self.checkpoint_state())
+
+    def start_embedded_broker(self):
+        from . import broker  # imported here to keep asyncio out of startup when the broker isn't embedded
+        self.broker = broker.BrokerThread('0.0.0.0', self.broker_port).start()
 
     def run(self):
-        self.connect(self.broker_address)
+        if self.embedded_broker:
+            self.start_embedded_broker()
+        self.connect(self.broker_address, self.broker_port)
         self.loop_start()
 
         while True:
-            time.sleep(sleep_period_seconds)
+            self.wait_for_analysis_due()
             self.analyse_state()
+            self.checkpoint_if_due()
 
     def start_web_server(self):
-        ui_server.run_app(self)
+        from web_ui import ui_server  # flask, jinja and waitress load on the web thread, not before the first decision
+        ui_server.run_app(self, self.web_server_mode)
 
     @_lock
     def increase_target_temp(self):
         self.target_temperature += 1
         if self.target_temperature > 30:
             self.target_temperature = 30
+        self.publish_snapshot()
+        self.notify_inputs_changed()
 
     @_lock
     def decrease_target_temp(self):
         self.target_temperature -= 1
         if self.target_temperature < 10:
             self.target_temperature = 10
+        self.publish_snapshot()
+        self.notify_inputs_changed()
 
     @_lock
     def request_flush(self):
         self._hard_flush_requested = True
+        self.publish_snapshot()
+        self.notify_inputs_changed()
 
     @_lock
     def set_flush_request_handled(self):
@@ -174,6 +507,8 @@ class Controller(mqtt.Client):
     @_lock
     def toggle_enable(self):
         self.enabled = not self.enabled
+        self.publish_snapshot()
+        self.notify_inputs_changed()
 
 # diagnostic methods for buttons which manually control hardware when system is disabled.
 # these will break the state machine and should be used with care.
@@ -181,31 +516,31 @@ class Controller(mqtt.Client):
     def diagnostic_extract_living(self):
         if self.enabled:
             raise DiagnosticsError
-        self.publish(str(Topic.SET_VALVES), payload=ValveStates.extract_from_living, qos=0)
+        self.command(self.valves, ValveStates.extract_from_living, qos=0, force=True)
 
     @_lock
     def diagnostic_extract_roof(self):
         if self.enabled:
             raise DiagnosticsError
-        self.publish(str(Topic.SET_VALVES), payload=ValveStates.extract_from_roof, qos=0)
+        self.command(self.valves, ValveStates.extract_from_roof, qos=0, force=True)
 
     @_lock
     def diagnostic_fan_off(self):
         if self.enabled:
             raise DiagnosticsError
-        self.publish(str(Topic.SET_FAN), payload=FanSpeeds.OFF, qos=0)
+        self.command(self.fan, FanSpeeds.OFF, qos=0, force=True)
 
     @_lock
     def diagnostic_fan_low(self):
         if self.enabled:
             raise DiagnosticsError
-        self.publish(str(Topic.SET_FAN), payload=FanSpeeds.LOW, qos=0)
+        self.command(self.fan, FanSpeeds.LOW, qos=0, force=True)
 
     @_lock
     def diagnostic_fan_high(self):
         if self.enabled:
             raise DiagnosticsError
-        self.publish(str(Topic.SET_FAN), payload=FanSpeeds.HIGH, qos=0)
+        self.command(self.fan, FanSpeeds.HIGH, qos=0, force=True)
 
 
 class DiagnosticsError(Exception):
@@ -213,5 +548,6 @@ class DiagnosticsError(Exception):
 
 
 def run_mqtt_controller():
-    mqttc = Controller()
+    log.configure()
+    mqttc = Controller(history_dir=default_history_dir, checkpoint_path=default_checkpoint_path)
     mqttc.run()
@@ -1,6 +1,7 @@
-import datetime
+import json
 from enum import IntEnum
 
+from . import clock
 from . import hardware_state_machine
 
 
@@ -27,6 +28,28 @@ class EventSelector:
     quiet_fan_start = 19
     quiet_fan_end = 8
     high_bedroom_error = 3
+    parameter_names = ['target_humidity', 'max_rh', 'temp_hysteresis', 'min_temp_error_to_activate',
+                       'min_temp_advantage', 'terrible_roof_error', 'humidity_hysteresis', 'min_humidity_advantage',
+                       'beginning_bed_time', 'getting_up_time', 'quiet_fan_start', 'quiet_fan_end',
+                       'high_bedroom_error']
+
+    def get_parameters(self):
+        return {name: getattr(self, name) for name in self.parameter_names}
+
+    def set_parameters(self, parameters):
+        # instance attributes override the class defaults so other selectors are unaffected
+        for name, value in parameters.items():
+            if name not in self.parameter_names:
+                raise KeyError('unknown EventSelector parameter ' + name)
+            setattr(self, name, value)
+
+    def save_parameters(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.get_parameters(), f, indent=2, sort_keys=True)
+
+    def load_parameters(self, path):
+        with open(path) as f:
+            self.set_parameters(json.load(f))
 
     def select_event(self, enabled, fresh_data, climate_state, force_hard_flush, target_temperature):
         if fresh_data:
@@ -149,9 +172,9 @@ class EventSelector:
         return min(score, max_score)
 
     def _bedroom_temps_matter(self):
-        current_hour = datetime.datetime.now().hour
+        current_hour = clock.now().hour
         return current_hour >= self.beginning_bed_time or current_hour <= self.getting_up_time
 
     def _want_quiet_fan(self):
-        current_hour = datetime.datetime.now().hour
+        current_hour = clock.now().hour
         return current_hour >= self.quiet_fan_start or current_hour <= self.quiet_fan_end
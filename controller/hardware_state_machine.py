@@ -7,12 +7,13 @@ Micros periodically send climate data and listen for instructions to set fan and
 """
 
 import enum
-import time
 from collections import deque
 
 from transitions import Machine
 
 from common.common import sleep_period_seconds
+from . import clock
+from . import transition_table
 
 
 five_minutes = 60 * 5 - sleep_period_seconds / 2
@@ -38,7 +39,8 @@ class Actions(enum.Enum):
     VALVES_EXTRACT_LVRM = 4
 
 
-class HardwareState(Machine):
+class HardwareStateLogic:
+    # Conditions, callbacks and state actions shared by both state machine engines.
     states = ['idle', 'slow_ex_roof', 'slow_ex_lvrm', 'fast_ex_roof', 'fast_ex_lvrm']
     transitions = [
         {'trigger': roof_ideal_str, 'source': 'idle', 'dest': 'slow_ex_roof'},
@@ -97,23 +99,31 @@ class HardwareState(Machine):
         {'trigger': force_idle_str, 'source': 'fast_ex_lvrm', 'dest': 'idle'},
     ]
 
-    def __init__(self):
-        Machine.__init__(self, states=self.states, initial='idle', transitions=self.transitions,
-                         after_state_change=self.set_state_start_time_and_update_flushing)
-        self.state_start_time = time.time()
+    def _init_logic(self):
+        self.state_start_time = clock.time()
         self.pending_actions = deque([])
         self.flushing = False  # flush caused by timer
         self.hard_flushing = False  # flush forced by user input via web UI
 
     def set_state_start_time_and_update_flushing(self):
-        self.state_start_time = time.time()
+        self.state_start_time = clock.time()
         if self.state not in ['slow_ex_roof', 'slow_ex_lvrm']:
             self.flushing = False
         if self.state not in ['fast_ex_roof']:
             self.hard_flushing = False
 
+    def restore(self, state, state_start_time, flushing, hard_flushing):
+        # Puts the machine back in a checkpointed state without running any state actions.
+        if state not in self.states:
+            raise ValueError('unknown state: ' + repr(state))
+        self.state = state
+        self.state_start_time = state_start_time
+        self.flushing = flushing
+        self.hard_flushing = hard_flushing
+        self.pending_actions.clear()
+
     def get_state_age(self):
-        now = time.time()
+        now = clock.time()
         age = now - self.state_start_time
         return age
 
@@ -163,3 +173,20 @@ class HardwareState(Machine):
         self.pending_actions.clear()
         self.pending_actions.append(Actions.VALVES_EXTRACT_LVRM)
         self.pending_actions.append(Actions.FAN_HIGH)
+
+
+class HardwareState(HardwareStateLogic, Machine):
+    def __init__(self):
+        Machine.__init__(self, states=self.states, initial='idle', transitions=self.transitions,
+                         after_state_change=self.set_state_start_time_and_update_flushing)
+        self._init_logic()
+
+
+class CompiledHardwareState(HardwareStateLogic, transition_table.CompiledMachine):
+    # Same states and transitions as HardwareState without the per-trigger dispatch of transitions.
+    table = transition_table.TransitionTable(HardwareStateLogic.states, HardwareStateLogic.transitions)
+
+    def __init__(self):
+        transition_table.CompiledMachine.__init__(self, initial='idle',
+                                                  after_state_change=self.set_state_start_time_and_update_flushing)
+        self._init_logic()
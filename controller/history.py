@@ -0,0 +1,180 @@
+"""
+Time series store for sensor readings.
+Each sensor keeps its most recent samples in fixed size array backed ring buffers so memory is bounded. When a
+directory is given, samples are also queued and appended in batches to one binary file per sensor by a background
+writer thread, so appending from the mqtt network thread never touches the SD card. Files are rotated at
+max_file_bytes keeping one previous file, which bounds disk use to about twice that per sensor.
+"""
+
+import logging
+import os
+import struct
+import threading
+from array import array
+from collections import deque
+
+
+record = struct.Struct('<Ihh')  # unix seconds, temperature and humidity in hundredths
+default_capacity = 60 * 24 * 2  # two days at one report per minute
+default_flush_period_seconds = 60 * 10
+default_batch_size = 256
+default_max_file_bytes = 4 * 1024 * 1024
+logger = logging.getLogger(__name__)
+
+
+def to_centi(value):
+    return max(-32768, min(32767, int(round(value * 100))))
+
+
+class RingBuffer:
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.timestamps = array('I', [0]) * capacity
+        self.temps = array('h', [0]) * capacity
+        self.humidities = array('h', [0]) * capacity
+        self.start = 0
+        self.count = 0
+
+    def append(self, timestamp, centi_temp, centi_humidity):
+        i = (self.start + self.count) % self.capacity
+        self.timestamps[i] = timestamp
+        self.temps[i] = centi_temp
+        self.humidities[i] = centi_humidity
+        if self.count < self.capacity:
+            self.count += 1
+        else:
+            self.start = (self.start + 1) % self.capacity
+
+    def oldest_timestamp(self):
+        if self.count == 0:
+            return None
+        return self.timestamps[self.start]
+
+    def samples(self, start_time, end_time):
+        result = []
+        for n in range(self.count):
+            i = (self.start + n) % self.capacity
+            timestamp = self.timestamps[i]
+            if start_time <= timestamp < end_time:
+                result.append((timestamp, self.temps[i] / 100, self.humidities[i] / 100))
+        return result
+
+
+class HistoryStore:
+    def __init__(self, directory=None, capacity=default_capacity, flush_period_seconds=default_flush_period_seconds,
+                 batch_size=default_batch_size, max_file_bytes=default_max_file_bytes):
+        self.directory = directory
+        self.capacity = capacity
+        self.flush_period_seconds = flush_period_seconds
+        self.batch_size = batch_size
+        self.max_file_bytes = max_file_bytes
+        self._buffers = {}
+        self._pending = deque(maxlen=capacity)  # drops the oldest unwritten samples if the disk stops keeping up
+        self._lock = threading.Lock()
+        self._flush_requested = threading.Event()
+        self._stopped = False
+        self._writer = None
+        if directory is not None:
+            self._writer = threading.Thread(target=self._write_loop, name='history-writer', daemon=True)
+            self._writer.start()
+
+    def append(self, sensor, timestamp, temp, humidity):
+        sample = (int(timestamp), to_centi(temp), to_centi(humidity))
+        with self._lock:
+            buffer = self._buffers.get(sensor)
+            if buffer is None:
+                buffer = self._buffers[sensor] = RingBuffer(self.capacity)
+            buffer.append(*sample)
+            if self._writer is not None:
+                self._pending.append((sensor, sample))
+                if len(self._pending) >= self.batch_size:
+                    self._flush_requested.set()
+
+    def sensors(self):
+        with self._lock:
+            names = set(self._buffers)
+        if self.directory is not None and os.path.isdir(self.directory):
+            names.update(f[:-len('.bin')] for f in os.listdir(self.directory)
+                         if f.endswith('.bin') and not f.endswith('.1.bin'))
+        return sorted(names)
+
+    def query(self, sensor, start_time=0, end_time=float('inf')):
+        """
+        Returns (timestamp, temp, humidity) samples for start_time <= timestamp < end_time, oldest first.
+        """
+        with self._lock:
+            buffer = self._buffers.get(sensor)
+            oldest_in_memory = buffer.oldest_timestamp() if buffer is not None else None
+            recent = buffer.samples(start_time, end_time) if buffer is not None else []
+        older = []
+        if self.directory is not None:
+            disk_end = end_time if oldest_in_memory is None else min(end_time, oldest_in_memory)
+            older = self._read_disk(sensor, start_time, disk_end)
+        return older + recent
+
+    def downsample(self, sensor, start_time, end_time, bucket_seconds):
+        """
+        Returns (bucket_start, mean_temp, mean_humidity) per non empty bucket of bucket_seconds.
+        """
+        buckets = []
+        current = None
+        for timestamp, temp, humidity in self.query(sensor, start_time, end_time):
+            bucket_start = timestamp - (timestamp - int(start_time)) % bucket_seconds
+            if current is None or current[0] != bucket_start:
+                current = [bucket_start, 0.0, 0.0, 0]
+                buckets.append(current)
+            current[1] += temp
+            current[2] += humidity
+            current[3] += 1
+        return [(b[0], b[1] / b[3], b[2] / b[3]) for b in buckets]
+
+    def flush(self):
+        with self._lock:
+            batch = list(self._pending)
+            self._pending.clear()
+        if not batch:
+            return
+        by_sensor = {}
+        for sensor, sample in batch:
+            by_sensor.setdefault(sensor, bytearray()).extend(record.pack(*sample))
+        os.makedirs(self.directory, exist_ok=True)
+        for sensor, data in by_sensor.items():
+            path = self._path(sensor)
+            if os.path.exists(path) and os.path.getsize(path) + len(data) > self.max_file_bytes:
+                os.replace(path, self._path(sensor, rotated=True))
+            with open(path, 'ab') as f:
+                f.write(data)
+
+    def close(self):
+        if self._writer is not None:
+            self._stopped = True
+            self._flush_requested.set()
+            self._writer.join()
+            self._writer = None
+
+    def _write_loop(self):
+        while not self._stopped:
+            self._flush_requested.wait(self.flush_period_seconds)
+            self._flush_requested.clear()
+            try:
+                self.flush()
+            except OSError as e:
+                logger.warning('history flush failed: %s', e)
+        self.flush()
+
+    def _path(self, sensor, rotated=False):
+        return os.path.join(self.directory, sensor + ('.1.bin' if rotated else '.bin'))
+
+    def _read_disk(self, sensor, start_time, end_time):
+        result = []
+        for path in [self._path(sensor, rotated=True), self._path(sensor)]:
+            try:
+                with open(path, 'rb') as f:
+                    data = f.read()
+            except FileNotFoundError:
+                continue
+            usable = len(data) - len(data) % record.size  # ignore a partial record from an interrupted write
+            for timestamp, temp, humidity in record.iter_unpack(memoryview(data)[:usable]):
+                if start_time <= timestamp < end_time:
+                    result.append((timestamp, temp / 100, humidity / 100))
+        return result
@@ -0,0 +1,110 @@
+"""
+Logging for the controller with the formatting and I/O done on a background thread.
+Modules log through logging.getLogger(__name__) as usual. configure() puts a QueueHandler on the root logger so a
+call on paho's network thread only builds a LogRecord and puts it on a bounded queue. A QueueListener thread formats
+the records and writes them to stderr and to compact rotating files. If the writer falls behind, for example on a
+slow SD card, records are dropped and counted rather than blocking the caller.
+High rate events such as every mqtt message are logged at DEBUG and can be thinned with a SamplingFilter.
+"""
+
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+
+
+default_log_dir = os.path.join(os.path.expanduser('~'), 'ventilation_logs')
+log_format = '%(asctime)s %(levelname).1s %(name)s %(message)s'
+queue_size = 10000
+max_file_bytes = 1024 * 1024
+backup_count = 3
+message_logger_name = 'controller.messages'  # one record per mqtt message at DEBUG
+
+
+class SamplingFilter(logging.Filter):
+    # Passes one in every rate records below min_level, and every record at or above it.
+    def __init__(self, rate, min_level=logging.WARNING):
+        super().__init__()
+        self.rate = rate
+        self.min_level = min_level
+        self._count = 0
+
+    def filter(self, record):
+        if record.levelno >= self.min_level:
+            return True
+        passed = self._count % self.rate == 0
+        self._count += 1
+        return passed
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    # Leaves formatting to the listener thread and drops records when the queue is full.
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # The stock handler formats here, on the caller's thread. Log arguments must not be mutated after logging.
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class DropReportingListener(logging.handlers.QueueListener):
+    def __init__(self, log_queue, queue_handler, *handlers):
+        super().__init__(log_queue, *handlers, respect_handler_level=True)
+        self.queue_handler = queue_handler
+        self._reported_drops = 0
+
+    def handle(self, record):
+        dropped = self.queue_handler.dropped
+        if dropped != self._reported_drops:
+            self._reported_drops = dropped
+            super().handle(logging.getLogger(__name__).makeRecord(__name__, logging.WARNING, __file__, 0,
+                                                                  '%d log records dropped so far', (dropped,), None))
+        super().handle(record)
+
+
+_listener = None
+
+
+def configure(log_dir=default_log_dir, level=logging.INFO, message_sample_rate=None):
+    """
+    Routes all logging through the background writer. log_dir None logs to stderr only.
+    Returns the listener, which is stopped and flushed at exit.
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+    formatter = logging.Formatter(log_format)
+    handlers = [logging.StreamHandler()]
+    if log_dir is not None:
+        os.makedirs(log_dir, exist_ok=True)
+        handlers.append(logging.handlers.RotatingFileHandler(os.path.join(log_dir, 'controller.log'),
+                                                             maxBytes=max_file_bytes, backupCount=backup_count))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    log_queue = queue.Queue(queue_size)
+    queue_handler = NonBlockingQueueHandler(log_queue)
+    root = logging.getLogger()
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+    if message_sample_rate is not None:
+        logging.getLogger(message_logger_name).addFilter(SamplingFilter(message_sample_rate))
+    _listener = DropReportingListener(log_queue, queue_handler, *handlers)
+    _listener.start()
+    atexit.register(stop)
+    return _listener
+
+
+def stop():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        logging.getLogger().removeHandler(_listener.queue_handler)
+        _listener = None
@@ -0,0 +1,77 @@
+"""
+Routes mqtt messages to handlers by topic with a single dict lookup.
+Runs on paho's network thread so nothing is allowed to raise out of dispatch: unknown topics and malformed
+payloads are counted and dropped. Each handler keeps call counts and timings to show what on_message costs as
+sensors are added.
+"""
+
+import logging
+import time
+
+
+malformed_errors = (ValueError, TypeError, IndexError, UnicodeDecodeError)
+logger = logging.getLogger(__name__)
+
+
+class HandlerStats:
+    __slots__ = ('calls', 'errors', 'total_ns', 'max_ns')
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.total_ns = 0
+        self.max_ns = 0
+
+    @property
+    def mean_us(self):
+        return self.total_ns / self.calls / 1000 if self.calls else 0.0
+
+    def __repr__(self):
+        return 'calls {} errors {} mean {:.1f} us max {:.1f} us'.format(self.calls, self.errors, self.mean_us,
+                                                                      self.max_ns / 1000)
+
+
+class MessageRouter:
+    def __init__(self):
+        self._handlers = {}
+        self.stats = {}
+        self.unknown = 0
+        self.malformed = 0
+
+    def register(self, topic, handler):
+        self._handlers[topic] = handler
+        self.stats[topic] = HandlerStats()
+
+    def ignore(self, topic):
+        # expected topics with nothing to do, such as the controller's own commands echoed by a wildcard
+        self._handlers[topic] = None
+
+    def dispatch(self, topic, payload):
+        """
+        Returns True if a handler accepted the payload, unless the handler returned False to say nothing changed.
+        """
+        try:
+            handler = self._handlers[topic]
+        except KeyError:
+            self.unknown += 1
+            return False
+        if handler is None:
+            return False
+        stats = self.stats[topic]
+        start = time.perf_counter_ns()
+        try:
+            return handler(payload) is not False
+        except malformed_errors:
+            self.malformed += 1
+            stats.errors += 1
+            return False
+        except Exception:
+            stats.errors += 1
+            logger.exception('handler for topic %s failed', topic)
+            return False
+        finally:
+            elapsed = time.perf_counter_ns() - start
+            stats.calls += 1
+            stats.total_ns += elapsed
+            if elapsed > stats.max_ns:
+                stats.max_ns = elapsed
@@ -0,0 +1,159 @@
+"""
+Counters and histograms for the controller, served in the Prometheus text format from /metrics.
+Recording is a dict lookup and an add, cheap enough to leave on in production on a Pi. Metrics are written by the
+threads which own the state they measure, mostly under the controller lock, and only read by a scrape, so they have
+no lock of their own. A scrape can see a histogram half way through an update, which only skews one sample.
+Values which are already kept elsewhere, such as MessageRouter stats and sensor ages, are read at scrape time.
+"""
+
+import bisect
+import time
+
+from . import clock
+
+
+prefix = 'ventilation_'
+duration_buckets = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+lock_wait_buckets = (0.00001, 0.0001, 0.001, 0.01, 0.1, 1.0)
+round_trip_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def format_labels(names, values):
+    if not names:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                          for name, value in zip(names, values)) + '}'
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, description, labels=()):
+        self.name = prefix + name
+        self.description = description
+        self.labels = labels
+        self.values = {}
+
+    def inc(self, *label_values, amount=1):
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def samples(self):
+        for label_values, value in list(self.values.items()):
+            yield self.name, format_labels(self.labels, label_values), value
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, description, buckets, labels=()):
+        self.name = prefix + name
+        self.description = description
+        self.buckets = buckets
+        self.labels = labels
+        self.values = {}  # label values -> [count per bucket..., count above the last bucket, sum]
+
+    def observe(self, value, *label_values):
+        counts = self.values.get(label_values)
+        if counts is None:
+            counts = self.values[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def samples(self):
+        for label_values, counts in list(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                labels = format_labels(self.labels + ('le',), label_values + (format_value(bound),))
+                yield self.name + '_bucket', labels, cumulative
+            labels = format_labels(self.labels, label_values)
+            yield self.name + '_count', labels, cumulative
+            yield self.name + '_sum', labels, counts[-1]
+
+
+class Collected:
+    # Read when scraped, function returns a number or a dict of label values to numbers.
+    def __init__(self, name, description, function, labels=(), kind='gauge'):
+        self.name = prefix + name
+        self.description = description
+        self.function = function
+        self.labels = labels
+        self.kind = kind
+
+    def samples(self):
+        values = self.function()
+        if not isinstance(values, dict):
+            values = {(): values}
+        for label_values, value in values.items():
+            yield self.name, format_labels(self.labels, label_values), value
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append('# HELP {} {}'.format(metric.name, metric.description))
+            lines.append('# TYPE {} {}'.format(metric.name, metric.kind))
+            for name, labels, value in metric.samples():
+                lines.append('{}{} {}'.format(name, labels, format_value(value)))
+        return '\n'.join(lines) + '\n'
+
+
+class ControllerMetrics(Registry):
+    max_pending_publishes = 256  # forgotten if their acknowledgement never arrives, e.g. across a reconnect
+
+    def __init__(self, controller):
+        super().__init__()
+        self.analysis_seconds = self.add(Histogram('analysis_seconds', 'Time taken by analyse_state.',
+                                                   duration_buckets))
+        self.events = self.add(Counter('events_total', 'Events chosen by the event selector.', ('event',)))
+        self.transitions = self.add(Counter('transitions_total', 'Hardware state changes by trigger.',
+                                            ('trigger', 'source', 'dest')))
+        self.lock_wait_seconds = self.add(Histogram('lock_wait_seconds', 'Time spent waiting for the controller lock.',
+                                                    lock_wait_buckets))
+        self.publish_round_trip_seconds = self.add(Histogram(
+            'publish_round_trip_seconds', 'Time from publishing a qos 1 command to its acknowledgement.',
+            round_trip_buckets, ('topic',)))
+        router = controller.router
+        self.add(Collected('messages_total', 'Messages handled per topic.',
+                           lambda: {(topic,): stats.calls for topic, stats in router.stats.items()},
+                           ('topic',), 'counter'))
+        self.add(Collected('message_errors_total', 'Messages per topic whose handler raised.',
+                           lambda: {(topic,): stats.errors for topic, stats in router.stats.items()},
+                           ('topic',), 'counter'))
+        self.add(Collected('message_handler_seconds_total', 'Time spent in the handler per topic.',
+                           lambda: {(topic,): stats.total_ns / 1e9 for topic, stats in router.stats.items()},
+                           ('topic',), 'counter'))
+        self.add(Collected('messages_dropped_total', 'Messages dropped by the router.',
+                           lambda: {('unknown',): router.unknown, ('malformed',): router.malformed},
+                           ('reason',), 'counter'))
+        zone_data = controller.climate_state.zone_data
+        self.add(Collected('stale_sensors', 'Zones without a fresh reading.',
+                           lambda: sum(1 for data in zone_data.values() if not data.is_fresh())))
+        self.add(Collected('sensor_age_seconds', 'Time since each zone last reported.',
+                           lambda: {(name,): clock.time() - data.timestamp for name, data in zone_data.items()},
+                           ('zone',)))
+        self._publish_times = {}
+
+    def publish_sent(self, info, topic):
+        if len(self._publish_times) >= self.max_pending_publishes:
+            self._publish_times.clear()
+        self._publish_times[info.mid] = (time.perf_counter(), topic)
+
+    def publish_acknowledged(self, mid):
+        sent = self._publish_times.pop(mid, None)
+        if sent is not None:
+            self.publish_round_trip_seconds.observe(time.perf_counter() - sent[0], sent[1])
@@ -0,0 +1,133 @@
+"""
+Parameter sweep for EventSelector thresholds.
+Every combination of the given parameter values is replayed through the simulator against the same trace, spread
+over a process pool using all cores, and ranked by a weighted cost of comfort error and fan energy. The pareto
+front of the two is reported as well so the weighting can be judged. The chosen parameters are saved as json which
+EventSelector.load_parameters reads back.
+
+Usage: python -m controller.optimiser [trace.csv | --history DIR | --synthetic DAYS]
+           --param min_temp_advantage=1,2,3 --param temp_hysteresis=0.5,1 [--out best.json]
+"""
+
+import argparse
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from common.common import *
+from . import event_selector
+from . import simulator
+
+
+fan_watts = {FanSpeeds.OFF: 0, FanSpeeds.LOW: 30, FanSpeeds.HIGH: 80}
+comfort_weight = 1.0  # cost per degree of mean absolute error
+energy_weight = 1.0  # cost per kWh per day of fan energy
+_worker_trace = None
+_worker_options = None
+
+
+class SweepResult:
+    def __init__(self, parameters, simulation_result, days):
+        self.parameters = parameters
+        self.mean_abs_error = simulation_result.mean_abs_error
+        self.comfort_fraction = simulation_result.comfort_fraction
+        self.fan_hours = simulation_result.fan_seconds / 3600
+        self.energy_kwh_per_day = sum(fan_watts[speed] * seconds for speed, seconds in
+                                      simulation_result.fan_runtime.items()) / 3600 / 1000 / days
+        self.cost = comfort_weight * self.mean_abs_error + energy_weight * self.energy_kwh_per_day
+
+    def __repr__(self):
+        return 'cost {:.3f} error {:.2f} comfort {:.1%} energy {:.3f} kWh/day fan {:.1f} h {}'.format(
+            self.cost, self.mean_abs_error, self.comfort_fraction, self.energy_kwh_per_day, self.fan_hours,
+            self.parameters)
+
+
+def parameter_grid(values):
+    # values maps parameter names to lists of candidates, returns every combination as a dict
+    for name in values:
+        if name not in event_selector.EventSelector.parameter_names:
+            raise KeyError('unknown EventSelector parameter ' + name)
+    names = sorted(values)
+    return [dict(zip(names, combination)) for combination in itertools.product(*(values[n] for n in names))]
+
+
+def sweep(trace, values, workers=None, **simulator_options):
+    """
+    Returns SweepResults for every combination in values, lowest cost first.
+    """
+    grid = parameter_grid(values)
+    workers = workers or os.cpu_count()
+    chunksize = max(1, len(grid) // (4 * workers))  # few round trips while still balancing uneven runs
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(trace, simulator_options)) as executor:
+        results = list(executor.map(_evaluate, grid, chunksize=chunksize))
+    return sorted(results, key=lambda r: r.cost)
+
+
+def pareto_front(results):
+    # results not beaten on both comfort error and energy by any other, lowest error first
+    front = []
+    for result in sorted(results, key=lambda r: (r.mean_abs_error, r.energy_kwh_per_day)):
+        if not front or result.energy_kwh_per_day < front[-1].energy_kwh_per_day:
+            front.append(result)
+    return front
+
+
+def evaluate(trace, parameters, **simulator_options):
+    selector = event_selector.EventSelector()
+    selector.set_parameters(parameters)
+    result = simulator.Simulator(selector=selector, **simulator_options).run(trace)
+    days = max(1.0, (max(t[0] for t in trace) - min(t[0] for t in trace)) / 86400)
+    return SweepResult(parameters, result, days)
+
+
+def _init_worker(trace, simulator_options):
+    global _worker_trace, _worker_options
+    _worker_trace = sorted(trace)
+    _worker_options = simulator_options
+
+
+def _evaluate(parameters):
+    return evaluate(_worker_trace, parameters, **_worker_options)
+
+
+def _parse_param(text):
+    name, values = text.split('=')
+    return name, [float(v) if '.' in v else int(v) for v in values.split(',')]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Sweep EventSelector parameters against recorded history.')
+    parser.add_argument('trace', nargs='?', help='csv file with timestamp,sensor,temp,humidity columns')
+    parser.add_argument('--history', help='history directory written by the controller')
+    parser.add_argument('--synthetic', type=float, help='generate this many days of synthetic data')
+    parser.add_argument('--param', action='append', type=_parse_param, required=True,
+                        help='name=value1,value2,... may be repeated')
+    parser.add_argument('--target', type=float, default=21)
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--top', type=int, default=10)
+    parser.add_argument('--out', help='save the best parameters here as json')
+    args = parser.parse_args()
+
+    if args.history:
+        trace = simulator.load_history(args.history)
+    elif args.trace:
+        trace = simulator.load_csv(args.trace)
+    else:
+        trace = simulator.synthetic_trace(args.synthetic or 14)
+    results = sweep(trace, dict(args.param), workers=args.workers, target_temperature=args.target)
+    print('best by cost:')
+    for result in results[:args.top]:
+        print('  ' + repr(result))
+    print('pareto front:')
+    for result in pareto_front(results):
+        print('  ' + repr(result))
+    if args.out:
+        selector = event_selector.EventSelector()
+        selector.set_parameters(results[0].parameters)
+        selector.save_parameters(args.out)
+        print('saved ' + args.out)
+
+
+if __name__ == '__main__':
+    main()
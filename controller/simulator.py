@@ -0,0 +1,223 @@
+"""
+Offline replay of sensor traces through EventSelector and HardwareState on a virtual clock.
+A trace is a list of (timestamp, sensor, temp, humidity) samples with sensor one of bdrm, lvrm or roof. It can be
+read from a csv file with those columns, from a history directory written by the controller, or generated.
+The analysis runs once per step as the controller's periodic tick would, so weeks of data replay in seconds.
+
+Replayed room temperatures do not react to the fan. AirflowModel adds a first order estimate of the effect of
+moving air so that settings which run the fan more also change comfort, which parameter sweeps rely on.
+
+Usage: python -m controller.simulator [trace.csv | --history DIR | --synthetic DAYS] [--target 21]
+"""
+
+import argparse
+import csv
+import math
+from collections import Counter
+
+from common.common import *
+from . import clock
+from . import event_selector
+from . import hardware_state_machine
+from . import history
+from . import zones
+from .controller import ClimateState
+
+
+sensor_topics = {zone.name: zone.topic for zone in zones.default_zones}
+fan_speeds = {'idle': FanSpeeds.OFF, 'slow_ex_roof': FanSpeeds.LOW, 'slow_ex_lvrm': FanSpeeds.LOW,
+              'fast_ex_roof': FanSpeeds.HIGH, 'fast_ex_lvrm': FanSpeeds.HIGH}
+
+
+class AirflowModel:
+    # fraction of the difference to the source air exchanged per minute at each fan speed
+    exchange_rates = {FanSpeeds.OFF: 0.0, FanSpeeds.LOW: 0.01, FanSpeeds.HIGH: 0.03}
+    relax_rate = 0.02  # per minute decay of the fan's effect back to the recorded temperature
+
+    def __init__(self):
+        self.offsets = {'lvrm': 0.0, 'bdrm': 0.0}
+
+    def step(self, state, temps, minutes):
+        # temps are the recorded temperatures, returns the temperatures with the fan's effect applied
+        simulated = dict(temps)
+        for room in self.offsets:
+            simulated[room] = temps[room] + self.offsets[room]
+        rate = self.exchange_rates[fan_speeds[state]] * minutes
+        if state.endswith('ex_roof'):
+            targets = {'lvrm': simulated['roof'], 'bdrm': simulated['roof']}
+        elif state.endswith('ex_lvrm'):
+            targets = {'bdrm': simulated['lvrm']}
+        else:
+            targets = {}
+        for room in self.offsets:
+            offset = self.offsets[room] * (1 - self.relax_rate * minutes)
+            if room in targets:
+                offset += (targets[room] - simulated[room]) * rate
+            self.offsets[room] = offset
+            simulated[room] = temps[room] + offset
+        return simulated
+
+
+class SimulationResult:
+    def __init__(self, step_seconds):
+        self.step_seconds = step_seconds
+        self.timeline = []  # (timestamp, state) for every state change
+        self.time_in_state = Counter()
+        self.events = Counter()
+        self.fan_runtime = Counter()  # seconds per FanSpeeds value
+        self.comfort_seconds = 0
+        self.analysed_seconds = 0
+        self.abs_error_seconds = 0.0
+        self.stale_steps = 0
+
+    @property
+    def comfort_fraction(self):
+        return self.comfort_seconds / self.analysed_seconds if self.analysed_seconds else 0.0
+
+    @property
+    def mean_abs_error(self):
+        return self.abs_error_seconds / self.analysed_seconds if self.analysed_seconds else 0.0
+
+    @property
+    def fan_seconds(self):
+        return self.fan_runtime[FanSpeeds.LOW] + self.fan_runtime[FanSpeeds.HIGH]
+
+    def summary(self):
+        lines = ['time in comfort band: {:.1%}'.format(self.comfort_fraction),
+                 'mean abs temperature error: {:.2f}'.format(self.mean_abs_error),
+                 'fan runtime low: {:.1f} h, high: {:.1f} h'.format(self.fan_runtime[FanSpeeds.LOW] / 3600,
+                                                                   self.fan_runtime[FanSpeeds.HIGH] / 3600),
+                 'state changes: {}, steps with stale data: {}'.format(len(self.timeline) - 1, self.stale_steps)]
+        for state, seconds in sorted(self.time_in_state.items()):
+            lines.append('  {:<13} {:8.1f} h'.format(state, seconds / 3600))
+        return '\n'.join(lines)
+
+
+class Simulator:
+    def __init__(self, selector=None, target_temperature=21, comfort_band=1.0, step_seconds=sleep_period_seconds,
+                 airflow=True):
+        self.selector = selector if selector is not None else event_selector.EventSelector()
+        self.target_temperature = target_temperature
+        self.comfort_band = comfort_band
+        self.step_seconds = step_seconds
+        self.airflow = airflow
+
+    def run(self, trace):
+        trace = sorted(trace)
+        result = SimulationResult(self.step_seconds)
+        if not trace:
+            return result
+        virtual_clock = clock.VirtualClock(trace[0][0])
+        previous_clock = clock.set_clock(virtual_clock)
+        try:
+            self._run(trace, virtual_clock, result)
+        finally:
+            clock.set_clock(previous_clock)
+        return result
+
+    def _run(self, trace, virtual_clock, result):
+        climate_state = ClimateState(history.HistoryStore(capacity=1))
+        hardware_state = hardware_state_machine.CompiledHardwareState()
+        airflow = AirflowModel() if self.airflow else None
+        recorded = {}
+        result.timeline.append((virtual_clock.time(), hardware_state.state))
+        i = 0
+        end_time = trace[-1][0]
+        while virtual_clock.time() <= end_time:
+            now = virtual_clock.time()
+            arrived = set()
+            while i < len(trace) and trace[i][0] <= now:
+                timestamp, sensor, temp, humidity = trace[i]
+                recorded[sensor] = (temp, humidity)
+                arrived.add(sensor)
+                i += 1
+            self._update_climate(climate_state, hardware_state.state, recorded, arrived, airflow)
+
+            fresh = climate_state.is_fresh()
+            event = self.selector.select_event(True, fresh, climate_state, False, self.target_temperature)
+            getattr(hardware_state, event)()
+            hardware_state.pending_actions.clear()
+            self._record_step(result, event, fresh, climate_state, hardware_state, now)
+            virtual_clock.advance(self.step_seconds)
+
+    def _update_climate(self, climate_state, state, recorded, arrived, airflow):
+        # only sensors which reported during this step are updated so gaps in the trace go stale as they would live
+        temps = {sensor: reading[0] for sensor, reading in recorded.items()}
+        if airflow is not None and len(temps) == len(sensor_topics):
+            temps = airflow.step(state, temps, self.step_seconds / 60)
+        for sensor in arrived:
+            payload = '{} {}'.format(temps[sensor], recorded[sensor][1]).encode()
+            climate_state.process_update(sensor_topics[sensor], payload)
+
+    def _record_step(self, result, event, fresh, climate_state, hardware_state, now):
+        state = hardware_state.state
+        if state != result.timeline[-1][1]:
+            result.timeline.append((now, state))
+        result.events[event] += 1
+        result.time_in_state[state] += self.step_seconds
+        result.fan_runtime[fan_speeds[state]] += self.step_seconds
+        if not fresh:
+            result.stale_steps += 1
+            return
+        result.analysed_seconds += self.step_seconds
+        errors = [abs(climate_state.lvrm_data.get_temp() - self.target_temperature)]
+        if self.selector._bedroom_temps_matter():
+            errors.append(abs(climate_state.bdrm_data.get_temp() - self.target_temperature))
+        error = max(errors)
+        result.abs_error_seconds += error * self.step_seconds
+        if error <= self.comfort_band:
+            result.comfort_seconds += self.step_seconds
+
+
+def load_csv(path):
+    with open(path, newline='') as f:
+        return [(float(row['timestamp']), row['sensor'], float(row['temp']), float(row['humidity']))
+                for row in csv.DictReader(f)]
+
+
+def load_history(directory, start_time=0, end_time=float('inf')):
+    store = history.HistoryStore(directory)
+    trace = []
+    for sensor in sensor_topics:
+        trace.extend((t, sensor, temp, hum) for t, temp, hum in store.query(sensor, start_time, end_time))
+    store.close()
+    return trace
+
+
+def synthetic_trace(days, start_time=1577836800, report_period=sleep_period_seconds):
+    # Daily cycles with a hot afternoon roof and house lagging behind it.
+    trace = []
+    for n in range(int(days * 24 * 3600 / report_period)):
+        t = start_time + n * report_period
+        day_phase = 2 * math.pi * ((t % 86400) / 86400 - 0.625)  # peaks at 3pm
+        slow = math.sin(2 * math.pi * t / (86400 * 9))  # weather changing over days
+        roof = 20 + 3 * slow + 9 * math.cos(day_phase)
+        lvrm = 21 + 2 * slow + 2 * math.cos(day_phase - 0.8)
+        bdrm = 20.5 + 2 * slow + 1.5 * math.cos(day_phase - 1.0)
+        trace.append((t, 'roof', roof, 50 - 15 * math.cos(day_phase)))
+        trace.append((t, 'lvrm', lvrm, 45 + 8 * slow))
+        trace.append((t, 'bdrm', bdrm, 47 + 8 * slow))
+    return trace
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay sensor traces through the control logic.')
+    parser.add_argument('trace', nargs='?', help='csv file with timestamp,sensor,temp,humidity columns')
+    parser.add_argument('--history', help='history directory written by the controller')
+    parser.add_argument('--synthetic', type=float, help='generate this many days of synthetic data')
+    parser.add_argument('--target', type=float, default=21)
+    parser.add_argument('--no-airflow', action='store_true', help='replay recorded temperatures unchanged')
+    args = parser.parse_args()
+
+    if args.history:
+        trace = load_history(args.history)
+    elif args.trace:
+        trace = load_csv(args.trace)
+    else:
+        trace = synthetic_trace(args.synthetic or 7)
+    simulator = Simulator(target_temperature=args.target, airflow=not args.no_airflow)
+    print(simulator.run(trace).summary())
+
+
+if __name__ == '__main__':
+    main()
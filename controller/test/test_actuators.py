@@ -0,0 +1,60 @@
+import unittest
+
+from common.common import *
+from controller import actuators
+from controller import clock
+
+
+class TestActuators(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = clock.VirtualClock(1577836800)
+        self.previous_clock = clock.set_clock(self.clock)
+        self.fan = actuators.Actuator('fan', Topic.SET_FAN)
+
+    def tearDown(self):
+        clock.set_clock(self.previous_clock)
+
+    def send(self, value):
+        if self.fan.set_desired(value):
+            self.fan.mark_sent()
+            return True
+        return False
+
+    def test_only_changes_are_sent(self):
+        self.assertTrue(self.send(FanSpeeds.LOW))
+        self.assertFalse(self.send(FanSpeeds.LOW))
+        self.fan.report(FanSpeeds.LOW)
+        self.assertTrue(self.fan.converged())
+        self.assertFalse(self.send(FanSpeeds.LOW))
+        self.assertTrue(self.send(FanSpeeds.HIGH))
+
+    def test_already_reported_value_not_sent(self):
+        self.fan.report(FanSpeeds.OFF)  # retained state from before a controller restart
+        self.assertFalse(self.send(FanSpeeds.OFF))
+        self.assertIsNone(self.fan.due_command())
+
+    def test_retry_with_backoff_then_dead(self):
+        self.send(FanSpeeds.LOW)
+        retry_times = []
+        for second in range(0, 4 * 3600, 15):
+            self.clock.set(1577836800 + second)
+            if self.fan.due_command() is not None:
+                self.fan.mark_sent()
+                retry_times.append(second)
+        self.assertEqual(retry_times[:3], [45, 135, 315])
+        self.assertEqual(retry_times[-1] - retry_times[-2], actuators.retry_max_seconds)
+        self.assertTrue(self.fan.dead)
+        self.fan.report(FanSpeeds.LOW)
+        self.assertFalse(self.fan.dead)
+        self.assertEqual(self.fan.retries, 0)
+
+    def test_resent_when_reported_state_drifts(self):
+        self.send(FanSpeeds.HIGH)
+        self.fan.report(FanSpeeds.HIGH)
+        self.fan.report(FanSpeeds.OFF)  # roof client restarted
+        self.assertEqual(self.fan.due_command(), FanSpeeds.HIGH)
+
+
+if __name__ == '__main__':
+    unittest.main()
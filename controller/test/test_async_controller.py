@@ -0,0 +1,69 @@
+import asyncio
+import unittest
+
+from controller import async_controller
+from web_ui import aio_wsgi
+from web_ui import ui_server
+
+
+async def http_request(port, method, path):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write('{} {} HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n'.format(method, path).encode())
+    response = await reader.read()
+    writer.close()
+    return response
+
+
+class TestAsyncController(unittest.TestCase):
+
+    def test_coroutines_mutate_state_and_wake_analysis(self):
+        async def run():
+            controller = async_controller.AsyncController()
+            target = controller.core.target_temperature
+            await controller.increase_target_temp()
+            self.assertEqual(controller.core.target_temperature, target + 1)
+            self.assertTrue(controller._inputs_changed.is_set())
+            await controller.request_flush()
+            self.assertTrue(await controller.get_hard_flush_requested())
+        asyncio.run(run())
+
+    def test_web_ui_served_from_event_loop(self):
+        async def run():
+            controller = async_controller.AsyncController()
+            server = await aio_wsgi.serve(ui_server.init_app(controller.core), host='127.0.0.1', port=0)
+            port = server.sockets[0].getsockname()[1]
+            target = controller.core.target_temperature
+            response = await http_request(port, 'POST', '/increase_target')
+            self.assertTrue(response.startswith(b'HTTP/1.1 302'))
+            self.assertEqual(controller.core.target_temperature, target + 1)
+            response = await http_request(port, 'GET', '/')
+            self.assertTrue(response.startswith(b'HTTP/1.1 200'))
+            self.assertIn('<span id="target_temp">{}</span>'.format(target + 1).encode(), response)
+            server.close()
+            await server.wait_closed()
+        asyncio.run(run())
+
+    def test_event_stream_served_from_event_loop(self):
+        async def run():
+            controller = async_controller.AsyncController()
+            server = await aio_wsgi.serve(ui_server.init_app(controller.core), host='127.0.0.1', port=0,
+                                          streams=ui_server.async_streams)
+            port = server.sockets[0].getsockname()[1]
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(b'GET /api/events HTTP/1.1\r\nHost: localhost\r\n\r\n')
+            head = await reader.readuntil(b'\r\n\r\n')
+            self.assertIn(b'text/event-stream', head)
+            first = await reader.readuntil(b'\n\n')
+            self.assertIn(b'"target_temp"', first)
+            await controller.increase_target_temp()
+            second = await asyncio.wait_for(reader.readuntil(b'\n\n'), 5)
+            self.assertEqual(second, 'data: {{"target_temp": "{}"}}\n\n'.format(
+                controller.core.target_temperature).encode())
+            writer.close()
+            server.close()
+            await server.wait_closed()
+        asyncio.run(run())
+
+
+if __name__ == '__main__':
+    unittest.main()
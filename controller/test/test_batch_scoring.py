@@ -0,0 +1,83 @@
+import datetime
+import unittest
+
+import numpy as np
+
+from controller import batch_scoring
+from controller import clock
+from controller import event_selector
+from controller import hardware_state_machine
+from controller.controller import ClimateState
+from common.common import *
+
+
+class TestBatchScoring(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.selector = event_selector.EventSelector()
+        cls.virtual_clock = clock.VirtualClock()
+        cls.previous_clock = clock.set_clock(cls.virtual_clock)
+
+    @classmethod
+    def tearDownClass(cls):
+        clock.set_clock(cls.previous_clock)
+
+    def random_inputs(self, n, seed):
+        rng = np.random.default_rng(seed)
+        return {'roof_temps': rng.uniform(5, 40, n).round(1), 'lvrm_temps': rng.uniform(12, 30, n).round(1),
+                'bdrm_temps': rng.uniform(12, 30, n).round(1), 'roof_rhs': rng.uniform(20, 80, n).round(1),
+                'lvrm_rhs': rng.uniform(30, 80, n).round(1), 'bdrm_rhs': rng.uniform(30, 80, n).round(1),
+                'hours': rng.integers(0, 24, n)}
+
+    def scalar(self, i, inputs, target_temperature, enabled=True, fresh_data=True, force_hard_flush=False):
+        self.virtual_clock.set(datetime.datetime(2020, 1, 1, int(inputs['hours'][i])).timestamp())
+        climate_state = ClimateState()
+        climate_state.process_update(Topic.ROOF_TEMP_HUM, '{} {}'.format(
+            inputs['roof_temps'][i], inputs['roof_rhs'][i]).encode())
+        climate_state.process_update(Topic.LR_TEMP_HUM, '{} {}'.format(
+            inputs['lvrm_temps'][i], inputs['lvrm_rhs'][i]).encode())
+        climate_state.process_update(Topic.BR_TEMP_HUM, '{} {}'.format(
+            inputs['bdrm_temps'][i], inputs['bdrm_rhs'][i]).encode())
+        roof_diff = climate_state.roof_data.get_temp() - target_temperature
+        lvrm_diff = climate_state.lvrm_data.get_temp() - target_temperature
+        bdrm_diff = climate_state.bdrm_data.get_temp() - target_temperature
+        return (self.selector.get_roof_temp_score(roof_diff, lvrm_diff, bdrm_diff),
+                self.selector.get_lvrm_temp_score(lvrm_diff, bdrm_diff),
+                self.selector.get_roof_humidity_score(climate_state),
+                self.selector.is_roof_worst_source(roof_diff, lvrm_diff, bdrm_diff),
+                self.selector.select_event(enabled, fresh_data, climate_state, force_hard_flush, target_temperature))
+
+    def assert_equivalent(self, inputs, target_temperature):
+        batch = batch_scoring.score_batch(self.selector, target_temperature=target_temperature, **inputs)
+        for i in range(len(inputs['hours'])):
+            expected = self.scalar(i, inputs, target_temperature)
+            actual = (batch.roof_temp[i], batch.lvrm_temp[i], batch.roof_humidity[i], batch.roof_worst[i],
+                      batch.events[i])
+            self.assertEqual(expected, actual, {k: v[i] for k, v in inputs.items()})
+
+    def test_random_inputs_match_scalar_path(self):
+        for seed, target_temperature in [(1, 21), (2, 18), (3, 25)]:
+            self.assert_equivalent(self.random_inputs(2000, seed), target_temperature)
+
+    def test_boundaries_match_scalar_path(self):
+        # differences landing exactly on the thresholds
+        values = np.arange(17, 26, 0.5)
+        grid = np.array(np.meshgrid(values, values, values, [0, 12, 18])).reshape(4, -1)
+        inputs = {'roof_temps': grid[0], 'lvrm_temps': grid[1], 'bdrm_temps': grid[2], 'roof_rhs': grid[0] * 2,
+                  'lvrm_rhs': grid[1] * 3, 'bdrm_rhs': grid[2] * 2, 'hours': grid[3].astype(int)}
+        self.assert_equivalent(inputs, 21)
+
+    def test_flags_override_scores(self):
+        inputs = self.random_inputs(4, 4)
+        batch = batch_scoring.score_batch(self.selector, target_temperature=21, enabled=[False, True, True, True],
+                                          force_hard_flush=[True, True, False, False],
+                                          fresh_data=[True, True, False, True], **inputs)
+        self.assertEqual(list(batch.events[:3]), [hardware_state_machine.force_idle_str,
+                                                  hardware_state_machine.hard_flush_str,
+                                                  hardware_state_machine.lvrm_worst_str])
+        self.assertEqual(batch.events[3], self.scalar(3, inputs, 21)[4])
+
+
+if __name__ == '__main__':
+    unittest.main()
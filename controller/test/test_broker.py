@@ -0,0 +1,121 @@
+import time
+import unittest
+
+from paho.mqtt import client as mqtt
+
+from common.common import *
+from controller import broker
+from controller import controller
+from controller import hardware_state_machine
+
+
+def wait_for(condition, timeout=5):
+    end = time.time() + timeout
+    while not condition():
+        if time.time() > end:
+            raise AssertionError('timed out')
+        time.sleep(0.01)
+
+
+class TestBroker(unittest.TestCase):
+
+    def setUp(self):
+        self.broker_thread = broker.BrokerThread(port=0).start()
+        self.clients = []
+
+    def tearDown(self):
+        for client in self.clients:
+            client.disconnect()
+            client.loop_stop()
+        self.broker_thread.stop()
+
+    def connect(self, client_id, subscriptions=(), client=None, will=None):
+        client = client or mqtt.Client(client_id)
+        client.received = []
+        client.on_message = lambda c, userdata, msg: c.received.append((msg.topic, msg.payload, msg.retain))
+        if will is not None:
+            client.will_set(*will)
+        client.connect('127.0.0.1', self.broker_thread.port)
+        client.loop_start()
+        for topic_filter in subscriptions:
+            client.subscribe(topic_filter, qos=1)
+        wait_for(lambda: len(self.broker_thread.broker.sessions) == len(self.clients) + 1 and
+                 all(f in self.broker_thread.broker.sessions[client_id].subscriptions for f in subscriptions))
+        self.clients.append(client)
+        return client
+
+    def test_wildcards_and_qos(self):
+        everything = self.connect('everything', ['#'])
+        single = self.connect('single', ['+'])
+        nested = self.connect('nested', ['home/+/temp'])
+        publisher = self.connect('publisher')
+        publisher.publish('1', b'20.0 40.0', qos=0)
+        publisher.publish('home/bdrm/temp', b'21', qos=1)
+        wait_for(lambda: len(everything.received) == 2 and len(nested.received) == 1)
+        self.assertEqual(single.received, [('1', b'20.0 40.0', False)])
+        self.assertEqual(nested.received, [('home/bdrm/temp', b'21', False)])
+
+    def test_retained_and_will(self):
+        roof = mqtt.Client('roof')
+        self.connect('roof', client=roof, will=(str(Topic.VALVE_STATE), b'offline', 1, True))
+        roof.publish(str(Topic.FAN_STATE), b'2', qos=1, retain=True).wait_for_publish()
+        roof.loop_stop()  # so it doesn't reconnect
+        roof.socket().close()  # drop without DISCONNECT so the will is sent
+        self.clients.remove(roof)
+        wait_for(lambda: str(Topic.VALVE_STATE) in self.broker_thread.broker.retained)
+        late = self.connect('late', ['+'])
+        wait_for(lambda: len(late.received) == 2)
+        self.assertEqual(sorted(late.received), [(str(Topic.VALVE_STATE), b'offline', True),
+                                                 (str(Topic.FAN_STATE), b'2', True)])
+
+    def test_controller_end_to_end(self):
+        core = controller.Controller(web_server=False)
+        core.broker_port = self.broker_thread.port
+        roof = mqtt.Client('roof')
+
+        def on_roof_message(client, userdata, msg):
+            state_topic = Topic.FAN_STATE if msg.topic == str(Topic.SET_FAN) else Topic.VALVE_STATE
+            client.publish(str(state_topic), msg.payload, qos=1, retain=True)
+        self.connect('roof', [str(Topic.SET_FAN), str(Topic.SET_VALVES)], client=roof)
+        roof.on_message = on_roof_message
+        core.connect(core.broker_address, core.broker_port)
+        core.loop_start()
+        self.clients.append(core)
+        wait_for(lambda: any('+' in session.subscriptions
+                             for session in list(self.broker_thread.broker.sessions.values())))
+        sensors = self.connect('sensors')
+        for topic in (Topic.BR_TEMP_HUM, Topic.LR_TEMP_HUM, Topic.ROOF_TEMP_HUM):
+            sensors.publish(str(topic), b'20.0 40.0')
+        wait_for(core.climate_state.is_fresh)
+        core.perform_action(hardware_state_machine.Actions.VALVES_EXTRACT_ROOF)
+        core.perform_action(hardware_state_machine.Actions.FAN_LOW)  # sent once the valves report
+        wait_for(lambda: core.fan.converged() and core.valves.converged())
+        self.assertEqual(core.fan.reported, FanSpeeds.LOW)
+        self.assertTrue(core.valves_settled())
+
+    def test_retained_readings_seed_controller(self):
+        sensors = self.connect('sensors')
+        for topic in (Topic.BR_TEMP_HUM, Topic.LR_TEMP_HUM, Topic.ROOF_TEMP_HUM):
+            payload = '20.00 40.00 {}'.format(int(time.time()) - 5).encode()
+            sensors.publish(str(topic), payload, qos=1, retain=True).wait_for_publish()
+        self.connect('roof', client=mqtt.Client('roof'), will=(str(Topic.ROOF_TEMP_HUM), offline_payload, 1, True))
+        roof = self.clients.pop()
+        roof.loop_stop()
+        roof.socket().close()  # dropped, so the broker publishes its will
+        retained = self.broker_thread.broker.retained
+        wait_for(lambda: retained.get(str(Topic.ROOF_TEMP_HUM), (None, 0))[0] == offline_payload)
+        core = controller.Controller(web_server=False)
+        core.broker_port = self.broker_thread.port
+        core.connect(core.broker_address, core.broker_port)
+        core.loop_start()
+        self.clients.append(core)
+        wait_for(lambda: core.climate_state.lvrm_data.get_temp() is not None)
+        self.assertEqual(core.climate_state.bdrm_data.get_temp(), 20.0)
+        self.assertFalse(core.climate_state.roof_data.is_fresh())
+
+    def test_default_port_matches_controller(self):
+        self.assertEqual(broker.default_port, controller.default_broker_port)
+
+
+if __name__ == '__main__':
+    unittest.main()
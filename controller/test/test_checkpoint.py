@@ -0,0 +1,63 @@
+import os
+import tempfile
+import unittest
+
+from common.common import *
+from controller import checkpoint
+from controller import controller
+
+
+class TestCheckpoint(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'checkpoint.json')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_save_and_load(self):
+        checkpoint.save(self.path, {'a': 1})
+        self.assertEqual(checkpoint.load(self.path), {'a': 1, 'version': checkpoint.version})
+        self.assertEqual(os.listdir(self.directory.name), ['checkpoint.json'])
+
+    def test_unusable_checkpoints_ignored(self):
+        self.assertIsNone(checkpoint.load(self.path))
+        with open(self.path, 'w') as f:
+            f.write('{"target_temperature": 2')  # torn write from before the rename was used
+        self.assertIsNone(checkpoint.load(self.path))
+        with open(self.path, 'w') as f:
+            f.write('{"version": 0}')
+        self.assertIsNone(checkpoint.load(self.path))
+
+    def test_warm_restart(self):
+        core = controller.Controller(checkpoint_path=self.path, web_server=False)
+        core.climate_state.process_update(Topic.ROOF_TEMP_HUM, b'28.0 30.0')
+        core.climate_state.process_update(Topic.LR_TEMP_HUM, b'18.0 30.0')
+        core.climate_state.process_update(Topic.BR_TEMP_HUM, b'18.0 30.0')
+        core.decrease_target_temp()
+        core.hardware_state.roof_ideal()
+        core.perform_action(core.hardware_state.pending_actions.popleft())
+        core.save_checkpoint(core.checkpoint_state())
+
+        restarted = controller.Controller(checkpoint_path=self.path, web_server=False)
+        self.assertEqual(restarted.target_temperature, core.target_temperature)
+        self.assertEqual(restarted.hardware_state.state, 'slow_ex_roof')
+        self.assertEqual(restarted.hardware_state.state_start_time, core.hardware_state.state_start_time)
+        self.assertEqual(restarted.valves.desired, ValveStates.extract_from_roof)
+        self.assertTrue(restarted.climate_state.is_fresh())
+        self.assertEqual(restarted.snapshot.roof_temp, 28.0)
+        self.assertEqual(restarted.climate_state.lvrm_data.timestamp, core.climate_state.lvrm_data.timestamp)
+
+    def test_bad_checkpoint_changes_nothing(self):
+        checkpoint.save(self.path, {'target_temperature': 15, 'enabled': False,
+                                    'hardware_state': ['nowhere', 0, False, False], 'desired': [None, None],
+                                    'readings': {}})
+        restarted = controller.Controller(checkpoint_path=self.path, web_server=False)
+        self.assertEqual(restarted.target_temperature, 21)
+        self.assertTrue(restarted.enabled)
+        self.assertEqual(restarted.hardware_state.state, 'idle')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,9 @@
+import threading
+import time
 import unittest
 from unittest.mock import MagicMock
 
-from controller import controller
+from controller import controller, hardware_state_machine
 from common.common import *
 
 
@@ -9,7 +11,7 @@ class TestController(unittest.TestCase):
 
     @classmethod
     def setUpClass(cls):
-        cls._controller = controller.Controller()
+        cls._controller = controller.Controller(web_server=False)
         cls.perform_action = MagicMock(return_value=None)
 
     def set_state_age(self, age=60):
@@ -529,6 +531,115 @@ class TestController(unittest.TestCase):
         self._controller.analyse_state()
         self.assertEqual(self._controller.hardware_state.state, 'slow_ex_roof')
 
+    def test_input_change_triggers_prompt_analysis(self):
+        self._controller.debounce_seconds = 0
+        self._controller.notify_inputs_changed()
+        start = time.time()
+        self._controller.wait_for_analysis_due()
+        self.assertLess(time.time() - start, 1)
+        self.assertFalse(self._controller._inputs_changed.is_set())
+
+    def test_burst_of_inputs_coalesced(self):
+        core = controller.Controller(web_server=False)
+        core.debounce_seconds = 0.2
+        core.analyse_state = MagicMock()
+        stopped = threading.Event()
+
+        def run_loop():  # the analysis part of Controller.run
+            while not stopped.is_set():
+                core.wait_for_analysis_due()
+                if not stopped.is_set():
+                    core.analyse_state()
+        thread = threading.Thread(target=run_loop, daemon=True)
+        thread.start()
+        for i in range(5):
+            core.notify_inputs_changed()
+            time.sleep(0.02)
+        time.sleep(core.debounce_seconds + 0.3)
+        self.assertEqual(core.analyse_state.call_count, 1)
+        stopped.set()
+        core.notify_inputs_changed()
+        thread.join(2)
+
+    def test_valve_state_reported(self):
+        self._controller.router.dispatch(str(Topic.VALVE_STATE), str(ValveStates.transitioning).encode())
+        self.assertFalse(self._controller.valves_settled())
+        self._controller.router.dispatch(str(Topic.VALVE_STATE), str(ValveStates.extract_from_roof).encode())
+        self.assertEqual(self._controller.valves.reported, ValveStates.extract_from_roof)
+        self.assertTrue(self._controller.valves_settled())
+        self.assertFalse(self._controller.router.dispatch(str(Topic.VALVE_STATE), b'9'))
+        self.assertEqual(self._controller.valves.reported, ValveStates.extract_from_roof)
+
+    def test_malformed_actuator_state_releases_lock(self):
+        def send_garbage():
+            for topic in (Topic.FAN_STATE, Topic.VALVE_STATE):
+                self._controller.router.dispatch(str(topic), b'garbage')
+                self._controller.router.dispatch(str(topic), b'99')
+        sender = threading.Thread(target=send_garbage)
+        sender.start()
+        sender.join()
+        analysis = threading.Thread(target=self._controller.analyse_state, daemon=True)
+        analysis.start()
+        analysis.join(2)
+        self.assertFalse(analysis.is_alive())
+
+    def test_fan_waits_for_valves(self):
+        core = controller.Controller(web_server=False)
+        core.publish = MagicMock()
+
+        def run_actions():
+            while len(core.hardware_state.pending_actions) > 0:
+                core.perform_action(core.hardware_state.pending_actions.popleft())
+
+        def report(topic, value):
+            core.router.dispatch(str(topic), str(value).encode())
+        report(Topic.FAN_STATE, FanSpeeds.OFF)
+        core.hardware_state.roof_ideal()
+        run_actions()
+        sent = [call.args[0] for call in core.publish.call_args_list]
+        self.assertEqual(sent, [str(Topic.SET_VALVES)])
+        self.assertEqual(core.pending_fan, FanSpeeds.LOW)
+        report(Topic.VALVE_STATE, ValveStates.transitioning)
+        self.assertEqual(core.publish.call_count, 1)
+        report(Topic.VALVE_STATE, ValveStates.extract_from_roof)
+        core.publish.assert_called_with(str(Topic.SET_FAN), payload=FanSpeeds.LOW, qos=1)
+        self.assertIsNone(core.pending_fan)
+        report(Topic.FAN_STATE, FanSpeeds.LOW)
+
+        core.hardware_state.force_idle()
+        run_actions()
+        report(Topic.FAN_STATE, FanSpeeds.OFF)
+        core.hardware_state.lvrm_ideal()
+        run_actions()
+        report(Topic.VALVE_STATE, ValveStates.extract_from_living)
+        report(Topic.FAN_STATE, FanSpeeds.LOW)
+        self.assertEqual(core.hardware_state.state, 'slow_ex_lvrm')
+        core.publish.reset_mock()
+        core.hardware_state.hard_flush()  # the fan is running and the valves have to move
+        run_actions()
+        core.publish.assert_called_with(str(Topic.SET_FAN), payload=FanSpeeds.OFF, qos=1)
+        self.assertEqual(core.pending_fan, FanSpeeds.HIGH)
+        report(Topic.FAN_STATE, FanSpeeds.OFF)
+        report(Topic.VALVE_STATE, ValveStates.extract_from_roof)
+        core.publish.assert_called_with(str(Topic.SET_FAN), payload=FanSpeeds.HIGH, qos=1)
+        self.assertIsNone(core.pending_fan)
+
+    def test_snapshot_published_after_analysis(self):
+        self.set_state_age(0)
+        self.set_fresh_data(True)
+        self.set_bedroom_temps_matter(False)
+        self.set_want_quiet_fan(False)
+        self._controller.climate_state.process_update(Topic.ROOF_TEMP_HUM, b'28.0 30.0')
+        self._controller.climate_state.process_update(Topic.LR_TEMP_HUM, b'18.0 30.0')
+        self._controller.climate_state.process_update(Topic.BR_TEMP_HUM, b'18.0 30.0')
+        before = self._controller.snapshot
+        self._controller.analyse_state()
+        snapshot = self._controller.snapshot
+        self.assertIsNot(snapshot, before)
+        self.assertEqual(snapshot.state, self._controller.hardware_state.state)
+        self.assertEqual(snapshot.roof_temp, 28.0)
+        self.assertFalse(snapshot.hard_flush_requested)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,53 @@
+import itertools
+import unittest
+from unittest.mock import MagicMock
+
+from controller import hardware_state_machine
+from controller import transition_table
+
+
+triggers = [hardware_state_machine.roof_ideal_str, hardware_state_machine.lvrm_ideal_str,
+            hardware_state_machine.roof_good__str, hardware_state_machine.lvrm_good__str,
+            hardware_state_machine.roof_go_on_str, hardware_state_machine.lvrm_go_on_str,
+            hardware_state_machine.roof_worst_str, hardware_state_machine.lvrm_worst_str,
+            hardware_state_machine.hard_flush_str, hardware_state_machine.force_idle_str]
+ages = [0, 400, 1000, 4000]
+
+
+class TestCompiledHardwareState(unittest.TestCase):
+
+    def run_trigger(self, machine, state, trigger, age, flushing, hard_flushing):
+        machine.state = state
+        machine.flushing = flushing
+        machine.hard_flushing = hard_flushing
+        machine.pending_actions.clear()
+        machine.state_start_time = 0
+        machine.get_state_age = MagicMock(return_value=age)
+        result = getattr(machine, trigger)()
+        return (result, machine.state, list(machine.pending_actions), machine.flushing, machine.hard_flushing,
+                machine.state_start_time != 0)
+
+    def test_same_outcome_as_transitions_machine(self):
+        reference = hardware_state_machine.HardwareState()
+        compiled = hardware_state_machine.CompiledHardwareState()
+        for state, trigger, age, flushing, hard_flushing in itertools.product(
+                hardware_state_machine.HardwareStateLogic.states, triggers, ages, [False, True], [False, True]):
+            args = (state, trigger, age, flushing, hard_flushing)
+            self.assertEqual(self.run_trigger(reference, *args), self.run_trigger(compiled, *args), args)
+
+    def test_initial_state(self):
+        self.assertEqual(hardware_state_machine.CompiledHardwareState().state, 'idle')
+
+    def test_unknown_trigger_for_state_raises(self):
+        table = transition_table.TransitionTable(['a', 'b'], [{'trigger': 'go', 'source': 'a', 'dest': 'b'}])
+
+        class Model(transition_table.CompiledMachine):
+            pass
+        Model.table = table
+        model = Model(initial='b')
+        with self.assertRaises(transition_table.TransitionError):
+            model.go()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import tempfile
+import unittest
+
+from controller import history
+
+
+class TestHistoryStore(unittest.TestCase):
+
+    def test_ring_buffer_keeps_most_recent(self):
+        store = history.HistoryStore(capacity=3)
+        for t in range(5):
+            store.append('roof', 1000 + t, 20 + t, 40)
+        self.assertEqual([s[0] for s in store.query('roof')], [1002, 1003, 1004])
+
+    def test_range_query(self):
+        store = history.HistoryStore()
+        for t in range(10):
+            store.append('lvrm', 60 * t, 21.25, 45.5)
+        samples = store.query('lvrm', 120, 300)
+        self.assertEqual(samples, [(120, 21.25, 45.5), (180, 21.25, 45.5), (240, 21.25, 45.5)])
+        self.assertEqual(store.query('bdrm'), [])
+
+    def test_downsample(self):
+        store = history.HistoryStore()
+        for t in range(6):
+            store.append('roof', 60 * t, 20 + t, 50)
+        self.assertEqual(store.downsample('roof', 0, 360, 180), [(0, 21.0, 50.0), (180, 24.0, 50.0)])
+
+    def test_flushed_samples_survive_restart_and_eviction(self):
+        with tempfile.TemporaryDirectory() as directory:
+            store = history.HistoryStore(directory, capacity=4, flush_period_seconds=3600)
+            for t in range(4):
+                store.append('bdrm', 100 + t, 18.5, 60)
+            store.flush()
+            for t in range(4, 8):
+                store.append('bdrm', 100 + t, 19.5, 61)  # evicts the flushed samples from memory
+            store.close()
+            self.assertEqual([s[0] for s in store.query('bdrm')], list(range(100, 108)))
+
+            reopened = history.HistoryStore(directory)
+            self.assertEqual(reopened.query('bdrm', 106), [(106, 19.5, 61.0), (107, 19.5, 61.0)])
+            self.assertEqual(reopened.sensors(), ['bdrm'])
+            reopened.close()
+
+    def test_rotation_bounds_file_size(self):
+        with tempfile.TemporaryDirectory() as directory:
+            store = history.HistoryStore(directory, max_file_bytes=history.record.size * 4)
+            for t in range(10):
+                store.append('roof', t, 20, 50)
+                store.flush()
+            store.close()
+            reopened = history.HistoryStore(directory, capacity=1)
+            self.assertEqual([s[0] for s in reopened.query('roof')], [4, 5, 6, 7, 8, 9])
+            reopened.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+import logging
+import os
+import queue
+import tempfile
+import unittest
+
+from controller import log
+
+
+class TestLog(unittest.TestCase):
+
+    def make_record(self, level=logging.DEBUG):
+        return logging.LogRecord('test', level, __file__, 0, 'message %s', ('args',), None)
+
+    def test_sampling_filter(self):
+        sampler = log.SamplingFilter(10)
+        passed = [sampler.filter(self.make_record()) for i in range(100)]
+        self.assertEqual(sum(passed), 10)
+        self.assertTrue(passed[0])
+        self.assertTrue(sampler.filter(self.make_record(logging.ERROR)))
+
+    def test_full_queue_drops_instead_of_blocking(self):
+        handler = log.NonBlockingQueueHandler(queue.Queue(2))
+        for i in range(5):
+            handler.handle(self.make_record(logging.INFO))
+        self.assertEqual(handler.dropped, 3)
+        record = handler.queue.get_nowait()
+        self.assertEqual(record.args, ('args',))  # formatted later by the listener
+
+    def test_written_by_listener(self):
+        with tempfile.TemporaryDirectory() as directory:
+            log.configure(directory)
+            try:
+                logging.getLogger('controller.test').info('hello %s', 'world')
+            finally:
+                log.stop()
+            with open(os.path.join(directory, 'controller.log')) as f:
+                self.assertIn('I controller.test hello world', f.read())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,44 @@
+import unittest
+
+from common.common import *
+from controller.controller import ClimateState
+from controller.message_router import MessageRouter
+
+
+class TestMessageRouter(unittest.TestCase):
+
+    def setUp(self):
+        self.climate_state = ClimateState()
+        self.router = MessageRouter()
+        self.router.register(str(Topic.BR_TEMP_HUM),
+                             lambda payload: self.climate_state.process_update(Topic.BR_TEMP_HUM, payload))
+        self.router.ignore(str(Topic.SET_FAN))
+
+    def test_dispatch(self):
+        self.assertTrue(self.router.dispatch(str(Topic.BR_TEMP_HUM), b'20.5 40.0'))
+        self.assertEqual(self.climate_state.bdrm_data.get_temp(), 20.5)
+        stats = self.router.stats[str(Topic.BR_TEMP_HUM)]
+        self.assertEqual(stats.calls, 1)
+        self.assertGreater(stats.total_ns, 0)
+
+    def test_rejects_without_raising(self):
+        self.assertFalse(self.router.dispatch('99', b'20.5 40.0'))
+        self.assertFalse(self.router.dispatch('garbage/topic', b''))
+        self.assertEqual(self.router.unknown, 2)
+        self.assertFalse(self.router.dispatch(str(Topic.BR_TEMP_HUM), b'20.5'))
+        self.assertFalse(self.router.dispatch(str(Topic.BR_TEMP_HUM), b'\xff\xfe'))
+        self.assertEqual(self.router.malformed, 2)
+        self.assertEqual(self.router.stats[str(Topic.BR_TEMP_HUM)].errors, 2)
+        self.assertFalse(self.router.dispatch(str(Topic.SET_FAN), b'1'))
+        self.assertEqual(self.router.unknown, 2)
+
+    def test_handler_failure_contained(self):
+        def broken(payload):
+            raise RuntimeError('boom')
+        self.router.register('7', broken)
+        self.assertFalse(self.router.dispatch('7', b''))
+        self.assertEqual(self.router.stats['7'].errors, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
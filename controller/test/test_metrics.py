@@ -0,0 +1,40 @@
+import unittest
+
+from controller import metrics
+
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = metrics.Registry()
+
+    def test_counter(self):
+        counter = self.registry.add(metrics.Counter('events_total', 'Events.', ('event',)))
+        counter.inc('roof_ideal')
+        counter.inc('roof_ideal')
+        counter.inc('say "hi"')
+        text = self.registry.render()
+        self.assertIn('# TYPE ventilation_events_total counter\n', text)
+        self.assertIn('ventilation_events_total{event="roof_ideal"} 2\n', text)
+        self.assertIn('ventilation_events_total{event="say \\"hi\\""} 1\n', text)
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = self.registry.add(metrics.Histogram('wait_seconds', 'Wait.', (0.1, 1.0)))
+        for value in (0.05, 0.1, 0.5, 2.0):
+            histogram.observe(value)
+        text = self.registry.render()
+        self.assertIn('ventilation_wait_seconds_bucket{le="0.1"} 2\n', text)
+        self.assertIn('ventilation_wait_seconds_bucket{le="1.0"} 3\n', text)
+        self.assertIn('ventilation_wait_seconds_bucket{le="+Inf"} 4\n', text)
+        self.assertIn('ventilation_wait_seconds_count 4\n', text)
+        self.assertIn('ventilation_wait_seconds_sum 2.65\n', text)
+
+    def test_collected_at_scrape(self):
+        values = {('a',): 1}
+        self.registry.add(metrics.Collected('things', 'Things.', lambda: values, ('name',)))
+        values[('b',)] = 2
+        self.assertIn('ventilation_things{name="b"} 2\n', self.registry.render())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+import os
+import tempfile
+import unittest
+
+from controller import event_selector
+from controller import optimiser
+from controller import simulator
+
+
+class TestOptimiser(unittest.TestCase):
+
+    def test_parameter_grid(self):
+        grid = optimiser.parameter_grid({'min_temp_advantage': [1, 2], 'max_rh': [50, 55, 60]})
+        self.assertEqual(len(grid), 6)
+        self.assertIn({'min_temp_advantage': 2, 'max_rh': 55}, grid)
+        with self.assertRaises(KeyError):
+            optimiser.parameter_grid({'not_a_parameter': [1]})
+
+    def test_sweep_ranks_by_cost(self):
+        trace = simulator.synthetic_trace(1)
+        results = optimiser.sweep(trace, {'min_temp_advantage': [1, 4]}, workers=2)
+        self.assertEqual(len(results), 2)
+        self.assertLessEqual(results[0].cost, results[1].cost)
+        self.assertGreaterEqual(len(optimiser.pareto_front(results)), 1)
+        single = optimiser.evaluate(trace, results[0].parameters)
+        self.assertAlmostEqual(single.cost, results[0].cost)
+
+    def test_parameters_load_back_into_selector(self):
+        selector = event_selector.EventSelector()
+        selector.set_parameters({'min_temp_advantage': 3, 'temp_hysteresis': 0.5})
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'parameters.json')
+            selector.save_parameters(path)
+            loaded = event_selector.EventSelector()
+            loaded.load_parameters(path)
+        self.assertEqual(loaded.get_parameters(), selector.get_parameters())
+        self.assertEqual(event_selector.EventSelector.min_temp_advantage, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
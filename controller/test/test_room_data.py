@@ -0,0 +1,103 @@
+import struct
+import time
+import unittest
+
+from common.common import *
+from controller.controller import ClimateState
+from controller.controller import RoomData
+from controller.controller import stale_after_seconds
+
+
+def pack(payload_format, *values):
+    return struct.pack(payload_layouts[payload_format], payload_format, *values)
+
+
+class TestRoomData(unittest.TestCase):
+
+    def test_text_payload(self):
+        room_data = RoomData(b'21.5 45.25')
+        self.assertEqual(room_data.temp, 21.5)
+        self.assertEqual(room_data.humidity, 45.25)
+        self.assertIsNone(room_data.sequence)
+        self.assertFalse(hasattr(room_data, '__dict__'))
+
+    def test_binary_payload(self):
+        room_data = RoomData(pack(PayloadFormat.CENTI, -512, 4525))
+        self.assertEqual(room_data.temp, -5.12)
+        self.assertEqual(room_data.humidity, 45.25)
+
+    def test_sequenced_payloads(self):
+        room_data = RoomData(pack(PayloadFormat.CENTI_SEQ, firmware_version, 65535, 2150, 4000))
+        self.assertEqual((room_data.firmware, room_data.sequence), (firmware_version, 65535))
+        self.assertEqual((room_data.temp, room_data.humidity), (21.5, 40.0))
+        # 0x6666 and 0x8000 are about 25 C and 50 %RH
+        room_data = RoomData(pack(PayloadFormat.RAW_SHT30, firmware_version, 7, 0x6666, 0x8000))
+        self.assertEqual(room_data.sequence, 7)
+        self.assertAlmostEqual(room_data.temp, 25.0, places=2)
+        self.assertAlmostEqual(room_data.humidity, 50.0, places=2)
+
+    def test_timed_payloads(self):
+        now = int(time.time())
+        room_data = RoomData('21.50 45.25 {}'.format(now).encode())
+        self.assertEqual((room_data.temp, room_data.humidity, room_data.timestamp), (21.5, 45.25, now))
+        room_data = RoomData(pack(PayloadFormat.CENTI_TIME, firmware_version, 3, now, 2150, 4000))
+        self.assertEqual((room_data.sequence, room_data.timestamp, room_data.temp), (3, now, 21.5))
+        room_data = RoomData(pack(PayloadFormat.CENTI_TIME, firmware_version, 3, 0, 2150, 4000))
+        self.assertIsNone(room_data.timestamp)
+        self.assertIsNone(RoomData(b'21.5 45.25').timestamp)
+
+    def test_rejects_bad_payloads(self):
+        for payload in [b'', b'21.5', b'21.5 abc', b'nan 40.0', b'21.5 nan', b'200.0 40.0', b'21.5 -3.0',
+                        b'21.5 40.0 7', pack(PayloadFormat.CENTI, 2150, 10100),
+                        pack(PayloadFormat.CENTI, 2150, 4000)[:-1], b'\x09\x00\x00\x00\x00',
+                        pack(PayloadFormat.RAW_SHT30, firmware_version, 7, 0x6666, 0xFFFF)[:-2]]:
+            with self.assertRaises(ValueError, msg=payload):
+                RoomData(payload)
+
+
+class TestDeviceTimestamps(unittest.TestCase):
+
+    def setUp(self):
+        self.climate_state = ClimateState()
+        self.data = self.climate_state.bdrm_data
+
+    def update(self, payload):
+        self.climate_state.process_update(Topic.BR_TEMP_HUM, payload)
+
+    def test_dated_by_sensor(self):
+        taken = int(time.time()) - 30
+        self.update('20.00 40.00 {}'.format(taken).encode())
+        self.assertEqual(self.data.timestamp, taken)
+        self.assertEqual(self.data.get_temp(), 20.0)
+
+    def test_old_retained_reading_is_stale(self):
+        self.update('20.00 40.00 {}'.format(int(time.time() - stale_after_seconds - 1)).encode())
+        self.assertIsNone(self.data.get_temp())
+
+    def test_older_reading_ignored(self):
+        now = int(time.time())
+        self.update('21.00 40.00 {}'.format(now).encode())
+        self.update('20.00 40.00 {}'.format(now - 10).encode())
+        self.assertEqual(self.data.get_temp(), 21.0)
+
+    def test_redelivered_reading_ignored(self):
+        payload = '20.00 40.00 {}'.format(int(time.time()) - 30).encode()
+        self.update(payload)
+        samples = len(self.climate_state.history.query('bdrm'))
+        self.assertIs(self.climate_state.process_update(Topic.BR_TEMP_HUM, payload), False)
+        self.assertEqual(len(self.climate_state.history.query('bdrm')), samples)
+
+    def test_future_reading_dated_now(self):
+        self.update('20.00 40.00 {}'.format(int(time.time()) + 3600).encode())
+        self.assertLessEqual(self.data.timestamp, time.time())
+
+    def test_offline_will_makes_zone_stale(self):
+        self.update(b'20.00 40.00')
+        self.update(offline_payload)
+        self.assertFalse(self.data.is_fresh())
+        self.update(b'20.00 40.00')
+        self.assertTrue(self.data.is_fresh())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,39 @@
+import time
+import unittest
+
+from common.common import *
+from controller import clock
+from controller import simulator
+
+
+start_time = 1577836800
+
+
+class TestSimulator(unittest.TestCase):
+
+    def test_replays_days_on_virtual_clock(self):
+        trace = simulator.synthetic_trace(2)
+        result = simulator.Simulator().run(trace)
+        steps = int((trace[-1][0] - trace[0][0]) / sleep_period_seconds) + 1
+        self.assertEqual(sum(result.time_in_state.values()), steps * sleep_period_seconds)
+        self.assertEqual(result.fan_seconds + result.fan_runtime[FanSpeeds.OFF], steps * sleep_period_seconds)
+        self.assertGreater(len(result.timeline), 1)
+        self.assertEqual(result.stale_steps, 0)
+        self.assertLess(abs(clock.time() - time.time()), 5)  # system clock restored
+
+    def test_flushes_hourly_when_roof_not_useful(self):
+        trace = [(start_time + t, sensor, 21.0, 40.0)
+                 for t in range(0, 4 * 3600, 60) for sensor in ['bdrm', 'lvrm', 'roof']]
+        result = simulator.Simulator(airflow=False).run(trace)
+        self.assertEqual(result.comfort_fraction, 1.0)
+        self.assertEqual([state for _, state in result.timeline[:3]], ['idle', 'slow_ex_roof', 'idle'])
+
+    def test_missing_sensor_is_stale(self):
+        trace = [(start_time + t, sensor, 21.0, 40.0) for t in range(0, 600, 60) for sensor in ['lvrm', 'roof']]
+        result = simulator.Simulator().run(trace)
+        self.assertEqual(result.stale_steps, 10)
+        self.assertEqual(result.analysed_seconds, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,159 @@
+import gzip
+import http.client
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+import unittest
+
+from controller import controller
+from web_ui import assets
+from web_ui import ui_server
+
+
+class TestUiServer(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.core = controller.Controller(web_server=False)
+
+    def setUp(self):
+        self.client = ui_server.init_app(self.core).test_client()
+
+    def test_state_api(self):
+        state = self.client.get('/api/state').get_json()
+        self.assertEqual(state['target_temp'], str(self.core.target_temperature))
+        self.assertEqual(state['roof_temp'], 'err°')
+        self.assertEqual(state['background'], ui_server.static_assets.url('ventilation_background.jpg'))
+
+    def test_buttons_return_state_to_script(self):
+        target = self.core.target_temperature
+        response = self.client.post('/decrease_target', headers={'Accept': 'application/json'})
+        self.assertEqual(response.get_json()['target_temp'], str(target - 1))
+        response = self.client.post('/increase_target')
+        self.assertEqual(response.status_code, 302)
+
+    def test_events_carry_only_changes(self):
+        events = ui_server.StateEvents()
+        first = json.loads(events.poll()[len(b'data: '):])
+        self.assertEqual(set(first), set(ui_server.page_state()))
+        self.assertIsNone(events.poll())
+        self.core.increase_target_temp()
+        self.assertEqual(json.loads(events.poll()[len(b'data: '):]), {'target_temp': str(self.core.target_temperature)})
+        self.core.decrease_target_temp()
+
+    def test_event_stream_woken_by_snapshot(self):
+        response = self.client.get('/api/events')
+        chunks = iter(response.response)
+        self.assertIn(b'"target_temp"', next(chunks))
+        timer = threading.Timer(0.1, self.core.increase_target_temp)
+        timer.start()
+        start = time.time()
+        self.assertEqual(json.loads(next(chunks)[len(b'data: '):]), {'target_temp': str(self.core.target_temperature)})
+        self.assertLess(time.time() - start, ui_server.stream_keepalive_seconds)
+        timer.join()
+        response.close()
+        self.core.decrease_target_temp()
+
+    @unittest.skipIf(ui_server.waitress is None, 'waitress not installed')
+    def test_streams_leave_workers_for_requests(self):
+        server = ui_server.waitress.create_server(ui_server.app, host='127.0.0.1', port=0,
+                                                  **ui_server.waitress_options)
+        threading.Thread(target=server.run, daemon=True).start()
+        streams = []
+        try:
+            for i in range(ui_server.waitress_options['threads']):
+                stream = socket.create_connection(('127.0.0.1', server.effective_port), timeout=5)
+                stream.sendall(b'GET /api/events HTTP/1.1\r\nHost: localhost\r\n\r\n')
+                streams.append(stream)
+            statuses = [stream.recv(12) for stream in streams]
+            self.assertEqual(statuses.count(b'HTTP/1.1 200'), ui_server.max_streams)
+            self.assertEqual(statuses.count(b'HTTP/1.1 503'), len(streams) - ui_server.max_streams)
+            connection = http.client.HTTPConnection('127.0.0.1', server.effective_port, timeout=5)
+            connection.request('GET', '/api/state')
+            self.assertEqual(connection.getresponse().status, 200)
+            connection.close()
+        finally:
+            for stream in streams:
+                stream.close()
+            time.sleep(0.2)  # for waitress to see the clients go
+            self.core.publish_snapshot()  # wakes the streams, which end and give back their slots
+            for i in range(ui_server.max_streams):
+                self.assertTrue(ui_server._stream_slots.acquire(timeout=5))
+            for i in range(ui_server.max_streams):
+                ui_server._stream_slots.release()
+            server.close()
+
+    def test_reads_do_not_take_controller_lock(self):
+        held = threading.Event()
+        release = threading.Event()
+
+        def hold_lock():
+            with self.core.lock:
+                held.set()
+                release.wait(5)
+        thread = threading.Thread(target=hold_lock)
+        thread.start()
+        held.wait(5)
+        try:
+            self.assertEqual(self.client.get('/api/state').status_code, 200)
+            self.assertEqual(self.client.get('/').status_code, 200)
+        finally:
+            release.set()
+            thread.join()
+
+    def test_page_state_shared_until_next_snapshot(self):
+        snapshot = self.core.snapshot
+        self.assertIs(ui_server.page_state(), ui_server.page_state())
+        self.core.request_flush()
+        self.assertIsNot(self.core.snapshot, snapshot)
+        self.assertEqual(ui_server.page_state()['flush_button_class'], 'pending_buttons')
+        self.core.set_flush_request_handled()
+        self.core.publish_snapshot()
+
+    def test_metrics(self):
+        self.core.analyse_state()
+        response = self.client.get('/metrics')
+        self.assertTrue(response.content_type.startswith('text/plain'))
+        text = response.get_data(as_text=True)
+        self.assertIn('ventilation_analysis_seconds_count', text)
+        self.assertIn('ventilation_events_total{event=', text)
+        self.assertIn('ventilation_lock_wait_seconds_bucket{le="+Inf"}', text)
+        self.assertIn('ventilation_stale_sensors 3\n', text)
+
+    def test_page_compressed(self):
+        response = self.client.get('/', headers={'Accept-Encoding': 'gzip, deflate'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertIn(ui_server.static_assets.url('style.css').encode(), gzip.decompress(response.data))
+
+    def test_fingerprinted_assets(self):
+        url = ui_server.static_assets.url('style.css')
+        response = self.client.get(url)
+        self.assertEqual(response.headers['Cache-Control'], assets.immutable_cache_control)
+        self.assertTrue(response.content_type.startswith('text/css'))
+        response = self.client.get(url, headers={'If-None-Match': response.headers['ETag']})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.client.get('/assets/style.000000000000.css').status_code, 404)
+
+    def test_built_variants_negotiated(self):
+        with tempfile.TemporaryDirectory() as directory:
+            table = assets.AssetTable(build_directory=directory)
+            written = [os.path.basename(path) for path in assets.build(table)]
+            css = table.by_name['style.css']
+            self.assertIn(css.fingerprinted_name + '.gz', written)
+            body, content_type, encoding, etag = table.select(css, accept_encoding='gzip')
+            self.assertEqual(encoding, 'gzip')
+            self.assertEqual(gzip.decompress(body), table.read(css.path))
+            body, content_type, encoding, etag = table.select(css)
+            self.assertIsNone(encoding)
+            if assets.optional_import('PIL.Image') is not None:
+                image = table.by_name['ventilation_background.jpg']
+                body, content_type, encoding, etag = table.select(image, accept='image/webp,*/*')
+                self.assertEqual(content_type, 'image/webp')
+                self.assertLess(len(body), os.path.getsize(image.path))
+
+
+if __name__ == '__main__':
+    unittest.main()
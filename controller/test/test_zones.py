@@ -0,0 +1,76 @@
+import json
+import os
+import tempfile
+import unittest
+
+from common.common import *
+from controller import clock
+from controller import zones
+from controller.controller import ClimateState
+
+
+class TestZones(unittest.TestCase):
+
+    def six_rooms(self):
+        return zones.ZoneRegistry([zones.Zone('roof', Topic.ROOF_TEMP_HUM, zones.Roles.ROOF),
+                                   zones.Zone('lvrm', Topic.LR_TEMP_HUM, zones.Roles.LIVING),
+                                   zones.Zone('kitchen', 10, zones.Roles.LIVING),
+                                   zones.Zone('bdrm', Topic.BR_TEMP_HUM, zones.Roles.BEDROOM),
+                                   zones.Zone('bdrm2', 11, zones.Roles.BEDROOM),
+                                   zones.Zone('bdrm3', 12, zones.Roles.BEDROOM)])
+
+    def test_roles_average_their_zones(self):
+        climate_state = ClimateState(zone_registry=self.six_rooms())
+        climate_state.process_update(Topic.LR_TEMP_HUM, b'20.0 40.0')
+        climate_state.process_update(10, b'22.0 50.0')
+        climate_state.process_update(Topic.BR_TEMP_HUM, b'18.0 40.0')
+        climate_state.process_update(11, b'19.0 40.0')
+        self.assertEqual(climate_state.lvrm_data.get_temp(), 21.0)
+        self.assertEqual(climate_state.lvrm_data.get_humidity(), 45.0)
+        self.assertEqual(climate_state.bdrm_data.get_temp(), 18.5)
+        self.assertFalse(climate_state.bdrm_data.is_fresh())
+        self.assertFalse(climate_state.is_fresh())
+        climate_state.process_update(12, b'20.0 40.0')
+        climate_state.process_update(Topic.ROOF_TEMP_HUM, b'30.0 20.0')
+        self.assertEqual(climate_state.bdrm_data.get_temp(), 19.0)
+        self.assertTrue(climate_state.is_fresh())
+
+    def test_unknown_topic_ignored(self):
+        climate_state = ClimateState()
+        climate_state.process_update(99, b'20.0 40.0')
+        self.assertFalse(climate_state.is_fresh())
+
+    def test_stable_sensor_stays_fresh_after_one_missed_heartbeat(self):
+        virtual_clock = clock.VirtualClock(1577836800)
+        previous = clock.set_clock(virtual_clock)
+        try:
+            climate_state = ClimateState()
+            climate_state.process_update(Topic.BR_TEMP_HUM, b'20.0 40.0')
+            # the first heartbeat is lost, the second is due a sample period late
+            virtual_clock.advance(2 * heartbeat_period_seconds + sensor_sample_period_seconds - 1)
+            self.assertTrue(climate_state.bdrm_data.is_fresh())
+            virtual_clock.advance(1)
+            self.assertFalse(climate_state.bdrm_data.is_fresh())
+        finally:
+            clock.set_clock(previous)
+
+    def test_registry_validation(self):
+        with self.assertRaises(ValueError):
+            zones.ZoneRegistry(zones.default_zones[:2])  # no roof
+        with self.assertRaises(ValueError):
+            zones.ZoneRegistry(zones.default_zones + [zones.Zone('bdrm2', Topic.BR_TEMP_HUM, zones.Roles.BEDROOM)])
+        with self.assertRaises(ValueError):
+            zones.ZoneRegistry(zones.default_zones + [zones.Zone('fan', Topic.SET_FAN, zones.Roles.BEDROOM)])
+
+    def test_load_from_config(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'zones.json')
+            with open(path, 'w') as f:
+                json.dump([{'name': z.name, 'topic': z.topic, 'role': z.role} for z in self.six_rooms().zones], f)
+            registry = zones.ZoneRegistry.load(path)
+        self.assertEqual(registry.by_topic[11].name, 'bdrm2')
+        self.assertEqual(len(registry.by_role[zones.Roles.BEDROOM]), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+"""
+Precompiled alternative to the transitions Machine.
+The states and transitions lists are compiled once into a table indexed by [state][trigger] holding
+(dest, conditions, before) entries, which each model instance binds to its own methods at construction.
+Semantics follow transitions for the features used here: conditions checked in order, before callbacks,
+on_exit_<source>, state change, on_enter_<dest> (also for reflexive transitions), after_state_change.
+"""
+
+
+class TransitionError(Exception):
+    pass
+
+
+class TransitionTable:
+    def __init__(self, states, transitions):
+        self.states = list(states)
+        self.state_index = {state: i for i, state in enumerate(self.states)}
+        self.triggers = []
+        for transition in transitions:
+            if transition['trigger'] not in self.triggers:
+                self.triggers.append(transition['trigger'])
+        self.trigger_index = {trigger: i for i, trigger in enumerate(self.triggers)}
+
+        # rows[state][trigger] is a tuple of candidates tried in declaration order
+        rows = [[[] for _ in self.triggers] for _ in self.states]
+        for transition in transitions:
+            source = self.state_index[transition['source']]
+            trigger = self.trigger_index[transition['trigger']]
+            dest = self.state_index[transition['dest']]
+            conditions = _listify(transition.get('conditions'))
+            before = _listify(transition.get('before'))
+            rows[source][trigger].append((dest, conditions, before))
+        self.rows = [[tuple(cell) for cell in row] for row in rows]
+
+
+class CompiledMachine:
+    """
+    Base for models driven by a TransitionTable. Subclasses set the class attribute table.
+    """
+    table = None
+
+    def __init__(self, initial, after_state_change=None):
+        table = self.table
+        self._after_state_change = after_state_change
+        self._on_exit = [getattr(self, 'on_exit_' + state, None) for state in table.states]
+        self._on_enter = [getattr(self, 'on_enter_' + state, None) for state in table.states]
+        self._rows = [[tuple((dest,
+                              tuple(getattr(self, name) for name in conditions),
+                              tuple(getattr(self, name) for name in before))
+                             for dest, conditions, before in cell)
+                       for cell in row]
+                      for row in table.rows]
+        self._state_index = table.state_index[initial]
+        for i, trigger in enumerate(table.triggers):
+            setattr(self, trigger, self._make_trigger(i))
+
+    @property
+    def state(self):
+        return self.table.states[self._state_index]
+
+    @state.setter
+    def state(self, value):
+        self._state_index = self.table.state_index[value]
+
+    def _make_trigger(self, trigger_index):
+        def trigger():
+            return self._fire(trigger_index)
+        return trigger
+
+    def _fire(self, trigger_index):
+        source = self._state_index
+        candidates = self._rows[source][trigger_index]
+        if not candidates:
+            raise TransitionError("Can't trigger event {} from state {}!".format(
+                self.table.triggers[trigger_index], self.table.states[source]))
+        for dest, conditions, before in candidates:
+            for condition in conditions:
+                if not condition():
+                    break
+            else:
+                return self._change_state(source, dest, before)
+        return False
+
+    def _change_state(self, source, dest, before):
+        for callback in before:
+            callback()
+        on_exit = self._on_exit[source]
+        if on_exit is not None:
+            on_exit()
+        self._state_index = dest
+        on_enter = self._on_enter[dest]
+        if on_enter is not None:
+            on_enter()
+        if self._after_state_change is not None:
+            self._after_state_change()
+        return True
+
+
+def _listify(names):
+    if names is None:
+        return ()
+    if isinstance(names, str):
+        return (names,)
+    return tuple(names)
@@ -0,0 +1,60 @@
+"""
+Registry of the rooms and sensors the controller reads.
+Each zone has a name, the mqtt topic its sensor publishes on and a role. The control logic works on roles, taking
+the mean of every fresh zone with that role, so an install can have any number of rooms of each kind.
+Zones are declared in a json list such as [{"name": "bdrm2", "topic": 11, "role": "bedroom"}, ...].
+"""
+
+import json
+
+from common.common import *
+
+
+class Roles:
+    ROOF = 'roof'
+    LIVING = 'living'
+    BEDROOM = 'bedroom'
+
+
+required_roles = [Roles.ROOF, Roles.LIVING, Roles.BEDROOM]
+
+
+class Zone:
+    def __init__(self, name, topic, role):
+        self.name = name
+        self.topic = topic
+        self.role = role
+
+    def __repr__(self):
+        return 'Zone({!r}, {}, {!r})'.format(self.name, self.topic, self.role)
+
+
+default_zones = [Zone('bdrm', Topic.BR_TEMP_HUM, Roles.BEDROOM),
+                 Zone('lvrm', Topic.LR_TEMP_HUM, Roles.LIVING),
+                 Zone('roof', Topic.ROOF_TEMP_HUM, Roles.ROOF)]
+
+
+class ZoneRegistry:
+    def __init__(self, zones=None):
+        self.zones = list(default_zones if zones is None else zones)
+        self.by_topic = {}
+        self.by_name = {}
+        self.by_role = {role: [] for role in required_roles}
+        for zone in self.zones:
+            if zone.topic in self.by_topic or zone.name in self.by_name:
+                raise ValueError('duplicate zone {!r}'.format(zone))
+            if zone.role not in self.by_role:
+                raise ValueError('unknown role for zone {!r}'.format(zone))
+            if zone.topic in (Topic.SET_FAN, Topic.SET_VALVES, Topic.VALVE_STATE, Topic.FAN_STATE):
+                raise ValueError('zone {!r} uses an actuator topic'.format(zone))
+            self.by_topic[zone.topic] = zone
+            self.by_name[zone.name] = zone
+            self.by_role[zone.role].append(zone)
+        for role, role_zones in self.by_role.items():
+            if not role_zones:
+                raise ValueError('no zone with role ' + role)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls([Zone(z['name'], int(z['topic']), z['role']) for z in json.load(f)])
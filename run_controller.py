@@ -1,6 +1,12 @@
+import sys
+
 from controller import controller
 
 
-# starts up mqtt controller and flask web ui
+# starts up mqtt controller and flask web ui, or with --asyncio runs both on a single event loop
 if __name__ == "__main__":
-    controller.run_mqtt_controller()
+    if '--asyncio' in sys.argv[1:]:
+        from controller import async_controller
+        async_controller.run_async_controller()
+    else:
+        controller.run_mqtt_controller()
@@ -0,0 +1,165 @@
+"""
+Minimal HTTP/1.1 server on asyncio which runs a WSGI app on the event loop thread.
+Used by the asyncio controller so the UI shares the loop that owns the controller state. Views are short and
+synchronous so they run inline, while reading requests and writing responses is asynchronous and bounded by
+timeouts, so a slow or stuck client only holds its own connection.
+Endless responses such as server sent events can't be WSGI generators here as they would block the loop, so they are
+given separately as streams, a map from path to an async generator of chunks.
+"""
+
+import asyncio
+import io
+import sys
+from urllib.parse import unquote
+
+
+max_header_bytes = 16 * 1024
+max_body_bytes = 64 * 1024
+request_timeout_seconds = 10
+keep_alive_timeout_seconds = 30
+status_reasons = {400: 'Bad Request', 408: 'Request Timeout', 413: 'Payload Too Large'}
+
+
+class HttpError(Exception):
+    def __init__(self, status):
+        super().__init__(status)
+        self.status = status
+
+
+async def serve(app, host='0.0.0.0', port=5000, streams=None):
+    async def handle(reader, writer):
+        await handle_connection(app, reader, writer, host, port, streams or {})
+    return await asyncio.start_server(handle, host, port)
+
+
+async def handle_connection(app, reader, writer, server_name, server_port, streams=None):
+    try:
+        keep_alive = True
+        first = True
+        while keep_alive:
+            timeout = request_timeout_seconds if first else keep_alive_timeout_seconds
+            try:
+                request = await asyncio.wait_for(read_request(reader), timeout)
+            except asyncio.TimeoutError:
+                if first:
+                    await write_error(writer, 408)
+                break
+            except HttpError as e:
+                await write_error(writer, e.status)
+                break
+            if request is None:
+                break
+            first = False
+            method, target, version, headers, body = request
+            keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+            environ = make_environ(method, target, version, headers, body, server_name, server_port)
+            stream = (streams or {}).get(environ['PATH_INFO'])
+            if stream is not None and method == 'GET':
+                await write_stream(writer, stream())
+                break
+            status, response_headers, chunks = run_app(app, environ)
+            await write_response(writer, status, response_headers, chunks, keep_alive)
+    except (ConnectionError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+        pass
+    finally:
+        writer.close()
+
+
+async def read_request(reader):
+    try:
+        head = await reader.readuntil(b'\r\n\r\n')
+    except asyncio.IncompleteReadError as e:
+        if not e.partial:
+            return None  # client closed an idle connection
+        raise HttpError(400)
+    except asyncio.LimitOverrunError:
+        raise HttpError(400)
+    if len(head) > max_header_bytes:
+        raise HttpError(400)
+    lines = head.decode('latin-1').split('\r\n')
+    try:
+        method, target, version = lines[0].split(' ')
+    except ValueError:
+        raise HttpError(400)
+    headers = {}
+    for line in lines[1:]:
+        if line:
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+    try:
+        length = int(headers.get('content-length', 0) or 0)
+    except ValueError:
+        raise HttpError(400)
+    if length < 0 or length > max_body_bytes:
+        raise HttpError(413)
+    body = await reader.readexactly(length) if length else b''
+    return method, target, version, headers, body
+
+
+def make_environ(method, target, version, headers, body, server_name, server_port):
+    path, _, query = target.partition('?')
+    environ = {
+        'REQUEST_METHOD': method,
+        'SCRIPT_NAME': '',
+        'PATH_INFO': unquote(path, 'latin-1'),
+        'QUERY_STRING': query,
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port),
+        'SERVER_PROTOCOL': version,
+        'CONTENT_TYPE': headers.get('content-type', ''),
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': False,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for name, value in headers.items():
+        if name not in ('content-type', 'content-length'):
+            environ['HTTP_' + name.upper().replace('-', '_')] = value
+    return environ
+
+
+def run_app(app, environ):
+    response = {}
+
+    def start_response(status, headers, exc_info=None):
+        response['status'] = status
+        response['headers'] = headers
+
+    result = app(environ, start_response)
+    try:
+        chunks = [chunk for chunk in result if chunk]
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+    return response['status'], response['headers'], chunks
+
+
+async def write_response(writer, status, headers, chunks, keep_alive):
+    headers = [(name, value) for name, value in headers if name.lower() not in ('content-length', 'connection')]
+    headers.append(('Content-Length', str(sum(len(chunk) for chunk in chunks))))
+    headers.append(('Connection', 'keep-alive' if keep_alive else 'close'))
+    head = 'HTTP/1.1 {}\r\n{}\r\n\r\n'.format(status, '\r\n'.join('{}: {}'.format(n, v) for n, v in headers))
+    writer.write(head.encode('latin-1'))
+    for chunk in chunks:
+        writer.write(chunk)
+    await asyncio.wait_for(writer.drain(), request_timeout_seconds)
+
+
+async def write_stream(writer, chunks):
+    head = ('HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n'
+            'Connection: close\r\n\r\n')
+    writer.write(head.encode('latin-1'))
+    try:
+        async for chunk in chunks:
+            writer.write(chunk)
+            await asyncio.wait_for(writer.drain(), request_timeout_seconds)
+    finally:
+        await chunks.aclose()
+
+
+async def write_error(writer, status):
+    await write_response(writer, '{} {}'.format(status, status_reasons[status]), [], [], keep_alive=False)
@@ -0,0 +1,130 @@
+"""
+Fingerprinted static assets for the web UI.
+Every file in static/ is served from /assets/<name>.<hash><ext> with a year long immutable cache lifetime, so a
+browser only downloads it again when its content changes. Running python -m web_ui.assets writes pre-compressed
+gzip and brotli copies of text files and WebP copies of images into static/build/, which are served in place of the
+original to browsers that accept them. brotli and Pillow are optional and their variants are skipped if missing.
+"""
+
+import gzip
+import hashlib
+import importlib
+import mimetypes
+import os
+
+
+static_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+build_dir = os.path.join(static_dir, 'build')
+url_prefix = '/assets/'
+immutable_cache_control = 'public, max-age=31536000, immutable'
+compressible_types = ('text/css', 'text/html', 'application/javascript', 'image/svg+xml')
+webp_source_types = ('image/jpeg', 'image/png')
+webp_quality = 80
+encodings = [('br', '.br'), ('gzip', '.gz')]  # in order of preference
+
+
+class Asset:
+    def __init__(self, name, path):
+        self.name = name
+        self.path = path
+        with open(path, 'rb') as f:
+            self.digest = hashlib.sha256(f.read()).hexdigest()[:12]
+        stem, ext = os.path.splitext(name)
+        self.fingerprinted_name = '{}.{}{}'.format(stem, self.digest, ext)
+        self.url = url_prefix + self.fingerprinted_name
+        self.content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+
+
+class AssetTable:
+    def __init__(self, directory=static_dir, build_directory=build_dir):
+        self.build_directory = build_directory
+        self.by_name = {}
+        self.by_fingerprinted_name = {}
+        self._cache = {}  # path -> bytes, the assets are small and few
+        for name in sorted(os.listdir(directory)):
+            path = os.path.join(directory, name)
+            if os.path.isfile(path) and not name.endswith('~'):
+                asset = Asset(name, path)
+                self.by_name[name] = asset
+                self.by_fingerprinted_name[asset.fingerprinted_name] = asset
+
+    def url(self, name):
+        return self.by_name[name].url
+
+    def variant_path(self, asset, suffix):
+        path = os.path.join(self.build_directory, asset.fingerprinted_name + suffix)
+        return path if os.path.isfile(path) else None
+
+    def select(self, asset, accept='', accept_encoding=''):
+        """
+        Returns (body, content type, content encoding or None, etag) of the best variant for the request headers.
+        """
+        if asset.content_type in webp_source_types and 'image/webp' in accept:
+            path = self.variant_path(asset, '.webp')
+            if path is not None:
+                return self.read(path), 'image/webp', None, '"{}-webp"'.format(asset.digest)
+        if asset.content_type in compressible_types:
+            for encoding, suffix in encodings:
+                if encoding in accept_encoding:
+                    path = self.variant_path(asset, suffix)
+                    if path is not None:
+                        return self.read(path), asset.content_type, encoding, '"{}-{}"'.format(asset.digest, encoding)
+        return self.read(asset.path), asset.content_type, None, '"{}"'.format(asset.digest)
+
+    def read(self, path):
+        data = self._cache.get(path)
+        if data is None:
+            with open(path, 'rb') as f:
+                data = self._cache[path] = f.read()
+        return data
+
+
+def optional_import(name):
+    # brotli and Pillow are only needed to build variants, so the server doesn't load them
+    try:
+        return importlib.import_module(name)
+    except ImportError:
+        return None
+
+
+def build(table=None):
+    # Writes the compressed and WebP variants for every asset, returns their paths.
+    table = table or AssetTable()
+    brotli = optional_import('brotli')
+    image = optional_import('PIL.Image')
+    os.makedirs(table.build_directory, exist_ok=True)
+    for name in os.listdir(table.build_directory):
+        if os.path.splitext(name)[0] not in table.by_fingerprinted_name:
+            os.remove(os.path.join(table.build_directory, name))  # variant of an old version
+    written = []
+    for asset in table.by_name.values():
+        target = os.path.join(table.build_directory, asset.fingerprinted_name)
+        if asset.content_type in compressible_types:
+            data = table.read(asset.path)
+            with open(target + '.gz', 'wb') as f:
+                f.write(gzip.compress(data, 9))
+            written.append(target + '.gz')
+            if brotli is not None:
+                with open(target + '.br', 'wb') as f:
+                    f.write(brotli.compress(data))
+                written.append(target + '.br')
+        if asset.content_type in webp_source_types and image is not None:
+            image.open(asset.path).save(target + '.webp', 'WEBP', quality=webp_quality, method=6)
+            written.append(target + '.webp')
+    return written
+
+
+def main():
+    table = AssetTable()
+    if optional_import('brotli') is None:
+        print('brotli not installed, skipping .br variants')
+    if optional_import('PIL.Image') is None:
+        print('Pillow not installed, skipping .webp variants')
+    for path in build(table):
+        name = os.path.basename(path)
+        original = table.by_fingerprinted_name[os.path.splitext(name)[0]]
+        print('{:<60} {:7d} -> {:7d} bytes'.format(name, os.path.getsize(original.path), os.path.getsize(path)))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,45 +1,71 @@
+import gzip
+import json
+import logging
+import threading
+import time
+
 import flask
 from flask import redirect
 from flask import url_for
 
-slow_ex_roof_bg = "../static/ventilation_background_slow_ex_roof.jpg"
-fast_ex_roof_bg = "../static/ventilation_background_fast_ex_roof.jpg"
-slow_ex_lvrm_bg = "../static/ventilation_background_slow_ex_lvrm.jpg"
-fast_ex_lvrm_bg = "../static/ventilation_background_fast_ex_lvrm.jpg"
-fan_off_bg = "../static/ventilation_background.jpg"
+from web_ui import assets
+
+try:
+    import waitress
+except ImportError:
+    waitress = None
+
+slow_ex_roof_bg = "ventilation_background_slow_ex_roof.jpg"
+fast_ex_roof_bg = "ventilation_background_fast_ex_roof.jpg"
+slow_ex_lvrm_bg = "ventilation_background_slow_ex_lvrm.jpg"
+fast_ex_lvrm_bg = "ventilation_background_fast_ex_lvrm.jpg"
+fan_off_bg = "ventilation_background.jpg"
+page_compression_level = 6
+stream_keepalive_seconds = 15
+stream_max_seconds = 300  # streams hold a worker thread, the browser reconnects after this
+stream_retry_seconds = 30
+web_port = 5000
+logger = logging.getLogger(__name__)
+# Waitress keeps slow clients on its I/O thread and only hands complete requests to the workers.
+waitress_options = {'threads': 8, 'connection_limit': 100, 'channel_timeout': 30, 'cleanup_interval': 10,
+                    'channel_request_lookahead': 1}  # lookahead lets a stream see its client go
+max_streams = waitress_options['threads'] // 2  # the other workers stay free for pages and buttons
+_stream_slots = threading.BoundedSemaphore(max_streams)
 controller = None
+_page_state_cache = (None, None)
 
 
 """Create and configure an instance of the Flask application."""
 app = flask.Flask(__name__)
+static_assets = assets.AssetTable()
+app.jinja_env.globals['asset_url'] = static_assets.url
 
 
-@app.route("/")
-def show_page():
-    global controller
-    roof_temp = temp_str(controller.climate_state.roof_data.get_temp())
-    lvrm_temp = temp_str(controller.climate_state.lvrm_data.get_temp())
-    bdrm_temp = temp_str(controller.climate_state.bdrm_data.get_temp())
-    roof_rh = hum_str(controller.climate_state.roof_data.get_humidity())
-    lvrm_rh = hum_str(controller.climate_state.lvrm_data.get_humidity())
-    bdrm_rh = hum_str(controller.climate_state.bdrm_data.get_humidity())
-    target_temp = str(controller.target_temperature)
+def page_state(snapshot=None):
+    # Everything the page displays, as rendered into the template and sent to the page's script.
+    # Read from the controller's published snapshot, so it never takes the controller lock or sees half an update.
+    global _page_state_cache
+    if snapshot is None:
+        snapshot = controller.snapshot
+    cached_snapshot, page = _page_state_cache
+    if cached_snapshot is snapshot:
+        return page
 
     flush_button_class = 'buttons'
-    if controller.get_hard_flush_requested():
+    if snapshot.hard_flush_requested:
         flush_button_class = 'pending_buttons'
 
     toggle_enable_value = 'Disable'
     toggle_enable_class = 'buttons'
     diagnostic_button_class = 'hidden_buttons'
-    if not controller.enabled:
+    if not snapshot.enabled:
         toggle_enable_value = 'Enable'
         diagnostic_button_class = 'diagnostic_buttons'
-        if controller.hardware_state.state != 'idle':
+        if snapshot.state != 'idle':
             toggle_enable_class = 'pending_buttons'
 
     bg_img = fan_off_bg
-    state = controller.hardware_state.state
+    state = snapshot.state
     if state == 'slow_ex_roof':
         bg_img = slow_ex_roof_bg
     elif state == 'slow_ex_lvrm':
@@ -48,41 +74,149 @@ def show_page():
         bg_img = fast_ex_roof_bg
     elif state == 'fast_ex_lvrm':
         bg_img = fast_ex_lvrm_bg
-    return flask.render_template('ventilation.html', background=bg_img, target_temp=target_temp,
-                                 roof_temp=roof_temp, roof_hum=roof_rh,
-                                 lvrm_temp=lvrm_temp, lvrm_hum=lvrm_rh,
-                                 bdrm_temp=bdrm_temp, bdrm_hum=bdrm_rh,
-                                 flush_button_class=flush_button_class, toggle_enable_class=toggle_enable_class,
-                                 toggle_enable_value=toggle_enable_value,
-                                 diagnostic_button_class=diagnostic_button_class)
+    page = {'background': static_assets.url(bg_img), 'target_temp': str(snapshot.target_temperature),
+            'roof_temp': temp_str(snapshot.roof_temp), 'roof_hum': hum_str(snapshot.roof_humidity),
+            'lvrm_temp': temp_str(snapshot.lvrm_temp), 'lvrm_hum': hum_str(snapshot.lvrm_humidity),
+            'bdrm_temp': temp_str(snapshot.bdrm_temp), 'bdrm_hum': hum_str(snapshot.bdrm_humidity),
+            'flush_button_class': flush_button_class, 'toggle_enable_class': toggle_enable_class,
+            'toggle_enable_value': toggle_enable_value, 'diagnostic_button_class': diagnostic_button_class}
+    _page_state_cache = (snapshot, page)  # every page and stream shares one dict until the next snapshot
+    return page
+
+
+class StateEvents:
+    # Server sent events for one client, carrying only the fields of page_state which changed.
+    def __init__(self):
+        self._last = {}
+        self.snapshot = None  # the last one polled
+        self._last_sent = time.time()
+
+    def poll(self):
+        snapshot = controller.snapshot
+        now = time.time()
+        if snapshot is not self.snapshot:  # nothing can have changed otherwise
+            self.snapshot = snapshot
+            state = page_state(snapshot)
+            delta = {key: value for key, value in state.items() if self._last.get(key) != value}
+            if delta:
+                self._last = state
+                self._last_sent = now
+                return 'data: {}\n\n'.format(json.dumps(delta)).encode()
+        if now - self._last_sent >= stream_keepalive_seconds:
+            self._last_sent = now
+            return b': keepalive\n\n'  # lets proxies and the client notice a dead connection
+        return None
+
+    def keepalive_due_in(self):
+        return max(0, self._last_sent + stream_keepalive_seconds - time.time())
+
+
+@app.route("/")
+def show_page():
+    page = flask.render_template('ventilation.html', **page_state())
+    if 'gzip' not in flask.request.headers.get('Accept-Encoding', ''):
+        return page
+    return flask.Response(gzip.compress(page.encode(), page_compression_level), content_type='text/html; charset=utf-8',
+                          headers={'Content-Encoding': 'gzip', 'Vary': 'Accept-Encoding'})
+
+
+@app.route(assets.url_prefix + '<name>')
+def asset(name):
+    static_asset = static_assets.by_fingerprinted_name.get(name)
+    if static_asset is None:
+        flask.abort(404)
+    body, content_type, encoding, etag = static_assets.select(static_asset, flask.request.headers.get('Accept', ''),
+                                                              flask.request.headers.get('Accept-Encoding', ''))
+    headers = {'Cache-Control': assets.immutable_cache_control, 'ETag': etag, 'Vary': 'Accept, Accept-Encoding'}
+    if flask.request.headers.get('If-None-Match') == etag:
+        return flask.Response(status=304, headers=headers)
+    if encoding is not None:
+        headers['Content-Encoding'] = encoding
+    return flask.Response(body, content_type=content_type, headers=headers)
+
+
+@app.route('/api/state')
+def api_state():
+    return flask.jsonify(page_state())
+
+
+@app.route('/metrics')
+def metrics():
+    return flask.Response(controller.metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@app.route('/api/events')
+def api_events():
+    # waitress can tell a closed tab before the stream next writes, which frees its slot sooner
+    client_disconnected = flask.request.environ.get('waitress.client_disconnected', lambda: False)
+
+    def stream():
+        events = StateEvents()
+        end = time.time() + stream_max_seconds
+        while not client_disconnected():
+            event = events.poll()
+            if event is not None:
+                yield event
+            remaining = end - time.time()
+            if remaining <= 0:
+                break
+            # woken by publish_snapshot, so an update reaches the page without polling
+            controller.wait_for_snapshot(events.snapshot, min(events.keepalive_due_in(), remaining))
+
+    if not _stream_slots.acquire(blocking=False):
+        return flask.Response('too many event streams\n', status=503, mimetype='text/plain',
+                              headers={'Retry-After': str(stream_retry_seconds)})
+    response = flask.Response(stream(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+    response.call_on_close(_stream_slots.release)  # the server closes it when the stream ends or the client goes
+    return response
+
+
+async def async_events():
+    # /api/events for the asyncio server, which can't run a blocking generator on the event loop
+    events = StateEvents()
+    while True:
+        event = events.poll()
+        if event is not None:
+            yield event
+        await controller.wait_for_snapshot_async(events.snapshot, events.keepalive_due_in())
+
+
+async_streams = {'/api/events': async_events}
+
+
+def done():
+    # buttons pressed from the page's script get the new state instead of a redirect and a full page load
+    if flask.request.headers.get('Accept') == 'application/json':
+        return flask.jsonify(page_state())
+    return redirect(url_for('show_page'))
 
 
 @app.route('/increase_target', methods=['POST', 'GET'])
 def increase_target():
     global controller
     controller.increase_target_temp()
-    return redirect(url_for('show_page'))
+    return done()
 
 
 @app.route('/decrease_target', methods=['POST', 'GET'])
 def decrease_target():
     global controller
     controller.decrease_target_temp()
-    return redirect(url_for('show_page'))
+    return done()
 
 
 @app.route('/toggle_enable', methods=['POST', 'GET'])
 def toggle_enable():
     global controller
     controller.toggle_enable()
-    return redirect(url_for('show_page'))
+    return done()
 
 
 @app.route('/flush', methods=['POST', 'GET'])
 def flush():
     global controller
     controller.request_flush()
-    return redirect(url_for('show_page'))
+    return done()
 
 
 # Handle diagnostic buttons
@@ -90,35 +224,35 @@ def flush():
 def extract_living():
     global controller
     controller.diagnostic_extract_living()
-    return redirect(url_for('show_page'))
+    return done()
 
 
 @app.route('/extract_roof', methods=['POST', 'GET'])
 def extract_roof():
     global controller
     controller.diagnostic_extract_roof()
-    return redirect(url_for('show_page'))
+    return done()
 
 
 @app.route('/fan_off', methods=['POST', 'GET'])
 def fan_off():
     global controller
     controller.diagnostic_fan_off()
-    return redirect(url_for('show_page'))
+    return done()
 
 
 @app.route('/fan_low', methods=['POST', 'GET'])
 def fan_low():
     global controller
     controller.diagnostic_fan_low()
-    return redirect(url_for('show_page'))
+    return done()
 
 
 @app.route('/fan_high', methods=['POST', 'GET'])
 def fan_high():
     global controller
     controller.diagnostic_fan_high()
-    return redirect(url_for('show_page'))
+    return done()
 
 
 def temp_str(float_as_str):
@@ -137,7 +271,19 @@ def hum_str(float_as_str):
     return str(rounded_float) + '%'
 
 
-def run_app(_controller):
+def init_app(_controller):
     global controller
     controller = _controller
-    app.run(host='0.0.0.0', debug=False, use_reloader=False)
+    return app
+
+
+def run_app(_controller, mode='waitress', host='0.0.0.0', port=web_port):
+    # mode is 'waitress' for production or 'flask' for Flask's development server
+    init_app(_controller)
+    if mode == 'waitress' and waitress is None:
+        logger.warning('waitress not installed, using the flask development server')
+        mode = 'flask'
+    if mode == 'waitress':
+        waitress.serve(app, host=host, port=port, **waitress_options)
+    else:
+        app.run(host=host, port=port, debug=False, use_reloader=False, threaded=True)